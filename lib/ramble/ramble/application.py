@@ -7,8 +7,12 @@
 # except according to those terms.
 """Define base classes for application definitions"""
 
+import concurrent.futures
+import glob
 import os
 import stat
+import hashlib
+import json
 import re
 import six
 import textwrap
@@ -24,6 +28,9 @@ import spack.util.spack_json
 import spack.util.environment
 
 import ramble.config
+import ramble.expander
+import ramble.fom_aggregate
+import ramble.fom_scanner
 import ramble.stage
 
 from ramble.language.application_language import ApplicationMeta
@@ -148,9 +155,15 @@ class ApplicationBase(object, metaclass=ApplicationMeta):
         """Run a phase, by getting it's function pointer"""
         if hasattr(self, '_%s' % phase):
             tty.msg('    Executing phase ' + phase)
-            self._add_expand_vars(expander)
             phase_func = getattr(self, '_%s' % phase)
-            phase_func(workspace, expander)
+            timer = workspace.pipeline_timer
+            if timer:
+                with timer.phase(phase):
+                    self._add_expand_vars(expander)
+                    phase_func(workspace, expander)
+            else:
+                self._add_expand_vars(expander)
+                phase_func(workspace, expander)
 
     def _get_env_set_commands(self, var_conf, var_set, shell='sh'):
         env_mods = spack.util.environment.EnvironmentModifications()
@@ -285,11 +298,13 @@ class ApplicationBase(object, metaclass=ApplicationMeta):
                         command.append(cmd)
 
         # ensure all log files are purged and set up
-        logs = set()
-        for executable in executables:
-            command_config = self.executables[executable]
-            if command_config['redirect']:
-                logs.add(expander.expand_var(command_config['redirect']))
+        redirects = [self.executables[executable]['redirect']
+                     for executable in executables
+                     if self.executables[executable]['redirect']]
+        logs = []
+        for log in expander.expand_many(redirects):
+            if log not in logs:
+                logs.append(log)
 
         for log in logs:
             command.append('rm -f "%s"' % log)
@@ -300,6 +315,16 @@ class ApplicationBase(object, metaclass=ApplicationMeta):
             exec_vars = {}
             command_config = self.executables[executable]
 
+            if isinstance(command_config['template'], list):
+                parts = command_config['template']
+            elif isinstance(command_config['template'],
+                            six.string_types):
+                parts = [command_config['template']]
+            else:
+                app_err = 'Unsupported template type in executable '
+                app_err += '%s' % executable
+                raise ApplicationError(app_err)
+
             if command_config['mpi']:
                 exec_vars['mpi_command'] = \
                     expander.expand_var('{mpi_command} ')
@@ -312,22 +337,9 @@ class ApplicationBase(object, metaclass=ApplicationMeta):
             else:
                 exec_vars['redirect'] = ''
 
-            if isinstance(command_config['template'], list):
-                for part in command_config['template']:
-                    command_part = '{mpi_command}%s{redirect}' % \
-                        part
-                    command.append(expander.expand_var(command_part,
-                                                       exec_vars))
-            elif isinstance(command_config['template'],
-                            six.string_types):
-                command_part = '{mpi_command}%s{redirect}' % \
-                    command_config['template']
-                command.append(expander.expand_var(command_part,
-                                                   exec_vars))
-            else:
-                app_err = 'Unsupported template type in executable '
-                app_err += '%s' % executable
-                raise ApplicationError(app_err)
+            command_parts = ['{mpi_command}%s{redirect}' % part
+                             for part in parts]
+            command.extend(expander.expand_many(command_parts, exec_vars))
 
             expander.remove_var('executable_name')
 
@@ -363,26 +375,23 @@ class ApplicationBase(object, metaclass=ApplicationMeta):
         experiment_run_dir = expander.experiment_run_dir
         fs.mkdirp(experiment_run_dir)
 
+        templates = []
         for template_name, template_val in workspace.all_templates():
             expand_path = os.path.join(experiment_run_dir, template_name)
             expander.set_var(template_name, expand_path, 'experiment')
+            templates.append((expand_path, template_val))
 
-        for template_name, template_val in workspace.all_templates():
-            expand_path = os.path.join(experiment_run_dir, template_name)
-
-            with open(expand_path, 'w+') as f:
-                f.write(expander.expand_var(template_val))
-            os.chmod(expand_path, stat.S_IRWXU | stat.S_IRWXG
-                     | stat.S_IROTH | stat.S_IXOTH)
-
-        experiment_script = expander.get_var('experiments_file')
-        experiment_script.write(expander.expand_var('{batch_submit}\n'))
+        submit_template = '{batch_submit}\n'
+        expansions = expander.snapshot_vars(
+            [template_val for _, template_val in templates] + [submit_template])
+        workspace.render_experiment(render_experiment_templates,
+                                    experiment_run_dir, expansions, templates,
+                                    submit_template)
 
         for template_name, template_val in workspace.all_templates():
             expander.remove_var(template_name)
 
     def _archive_experiments(self, workspace, expander):
-        import glob
         experiment_run_dir = expander.experiment_run_dir
         ws_archive_dir = workspace.latest_archive_path
 
@@ -404,110 +413,104 @@ class ApplicationBase(object, metaclass=ApplicationMeta):
                 shutil.copy(file, archive_experiment_dir)
 
         # Copy all archive patterns
-        for pattern in self.archive_patterns.keys():
-            exp_pattern = expander.expand_var(pattern)
+        for exp_pattern in expander.expand_many(self.archive_patterns.keys()):
             for file in glob.glob(exp_pattern):
                 shutil.copy(file, archive_experiment_dir)
 
     def _analyze_experiments(self, workspace, expander):
         """Perform experiment analysis.
 
-        This method will build up the fom_values dictionary. Its structure is:
-
-        fom_values[context][fom]
-
-        A fom can show up in multiple contexts, but
+        Collects the figures of merit to extract, and hands the log scanning
+        to analyze_experiment_logs through Workspace.analyze_experiment, which
+        may execute it in a worker process.
         """
-
-        def format_context(context_match, context_format):
-
-            keywords = {}
-            if isinstance(context_format, six.string_types):
-                for group in string.Formatter().parse(context_format):
-                    if group[1]:
-                        keywords[group[1]] = context_match[group[1]]
-
-            context_string = context_format.replace('{', '').replace('}', '') \
-                + ' = ' + context_format.format(**keywords)
-            return context_string
-
-        fom_values = {}
-
         files, contexts, foms = self._analysis_dicts(expander)
-        # Iterate over files. We already know they exist
-        for file, file_conf in files.items():
-
-            # Start with no active contexts in a file.
-            active_contexts = {}
-            tty.debug('Reading log file: %s' % file)
-
-            with open(file, 'r') as f:
-                for line in f.readlines():
-                    for context in file_conf['contexts']:
-                        context_conf = contexts[context]
-                        context_match = context_conf['regex'].match(line)
-
-                        if context_match:
-                            context_name = \
-                                format_context(context_match,
-                                               context_conf['format'])
-                            tty.debug('Line was: %s' % line)
-                            tty.debug(' Context match %s -- %s' %
-                                      (context, context_name))
-
-                            active_contexts[context] = context_name
-                            fom_values[context_name] = {}
-
-                    for fom in file_conf['foms']:
-                        fom_conf = foms[fom]
-                        fom_match = fom_conf['regex'].match(line)
-
-                        if fom_match and \
-                                (fom_conf['group'] in
-                                 fom_conf['regex'].groupindex):
-                            tty.debug(' --- Matched fom %s' % fom)
-                            fom_contexts = []
-                            if fom_conf['contexts']:
-                                for context in fom_conf['contexts']:
-                                    context_name = active_contexts[context] \
-                                        if context in active_contexts \
-                                        else 'null'
-                                    fom_contexts.append(context_name)
-                            else:
-                                fom_contexts.append('null')
-
-                            for context in fom_contexts:
-                                if context not in fom_values:
-                                    fom_values[context] = {}
-                                fom_val = fom_match.group(fom_conf['group'])
-                                fom_values[context][fom] = {
-                                    'value': fom_val,
-                                    'units': fom_conf['units']
-                                }
-
-        results = {}
         exp_ns = expander.experiment_namespace
-        results[exp_ns] = {}
 
-        tty.debug('fom_vals = %s' % fom_values)
-        if fom_values:
-            results[exp_ns]['RAMBLE_STATUS'] = 'SUCCESS'
-            results[exp_ns]['RAMBLE_VARIABLES'] = expander.all_vars()
-            results[exp_ns]['CONTEXTS'] = {}
+        # Without any log files, the experiment can only fail, so variables
+        # are only expanded when they might be needed.
+        variables = None
+        if files:
+            variables = self._results_variables(workspace, expander)
 
-            for context, foms in fom_values.items():
-                results[exp_ns]['CONTEXTS'][context] = foms.copy()
+        fingerprint = None
+        if files:
+            fingerprint = analysis_fingerprint(self._analysis_definitions_hash(),
+                                               files)
 
-        else:
-            results[exp_ns]['RAMBLE_STATUS'] = 'FAILED'
+        workspace.analyze_experiment(analyze_experiment_logs, exp_ns,
+                                     variables, files, contexts, foms,
+                                     self.figure_of_merit_aggregates,
+                                     fingerprint=fingerprint)
+
+    def _analysis_definitions_hash(self):
+        """Hash of the figure of merit and context definitions
+
+        Cached analysis results are only valid while this is unchanged.
+        """
+        if not hasattr(self, '_fom_definitions_hash'):
+            definitions = {
+                'figures_of_merit': self.figures_of_merit,
+                'contexts': self.figure_of_merit_contexts,
+                'aggregates': self.figure_of_merit_aggregates
+            }
+            definitions_json = json.dumps(definitions, sort_keys=True)
+            self._fom_definitions_hash = \
+                hashlib.sha256(definitions_json.encode('utf-8')).hexdigest()
+        return self._fom_definitions_hash
+
+    def _results_variables(self, workspace, expander):
+        """Expand the variables that are recorded in experiment results
+
+        By default, all variables are recorded. If config:results_variables
+        is set to 'referenced', only variables referenced by the experiment
+        name, templates, executables, figures of merit, archive patterns,
+        and the columns of the tabular results formats are recorded, along
+        with any listed in config:results_include_variables.
+        """
+        mode = ramble.config.get('config:results_variables', 'all')
+        if mode != 'referenced':
+            return expander.all_vars()
+
+        names = expander.referenced_vars(
+            self._results_variable_templates(workspace, expander))
+        names.update(ramble.config.get('config:results_include_variables', []))
+        return expander.all_vars(names=names)
+
+    def _results_variable_templates(self, workspace, expander):
+        """Return the templates that define which variables are referenced"""
+        templates = ['{%s}' % expander.app_name_key,
+                     '{%s}' % expander.wl_name_key,
+                     '{%s}' % expander.exp_name_key]
+        if expander.experiment_template:
+            templates.append(expander.experiment_template)
+
+        templates.extend(template_val for _, template_val
+                         in workspace.all_templates())
+
+        for executable in self.workloads[expander.workload_name]['executables']:
+            command_config = self.executables[executable]
+            if isinstance(command_config['template'], list):
+                templates.extend(command_config['template'])
+            else:
+                templates.append(command_config['template'])
+            if command_config['redirect']:
+                templates.append(command_config['redirect'])
 
-        workspace.append_result(results)
+        templates.extend(conf['log_file'] for conf
+                         in self.figures_of_merit.values())
+        templates.extend(self.archive_patterns.keys())
+        templates.extend('{%s}' % var for var
+                         in workspace.results_table_variables)
+        return templates
 
     def _analysis_dicts(self, expander):
         """Extract files that need to be analyzed.
 
-        Process figures_of_merit, and return the manipulated dictionaries
-        to allow them to be extracted.
+        Figure of merit and context regexes are compiled once per
+        application class, by their directives. Only the log files of the
+        figures of merit are expanded for each experiment. A log file can be
+        a glob pattern, in which case every matching file is analyzed.
 
         Returns:
            - files (dict): All files that need to be processed
@@ -517,44 +520,355 @@ class ApplicationBase(object, metaclass=ApplicationMeta):
 
         files = {}
         contexts = {}
-        foms = {}
+        foms = self.compiled_figures_of_merit
+
+        log_paths = expander.expand_many(conf['log_file'] for conf
+                                         in self.figures_of_merit.values())
+        # Existing files of each log path, which may be a glob pattern
+        log_files = {}
+        for (fom, conf), log_path in zip(self.figures_of_merit.items(),
+                                         log_paths):
+            if log_path not in log_files:
+                if glob.has_magic(log_path):
+                    log_files[log_path] = sorted(glob.glob(log_path))
+                elif os.path.exists(log_path):
+                    log_files[log_path] = [log_path]
+                else:
+                    log_files[log_path] = []
 
-        # Remap fom / context / file data
-        # Could push this into the language features in the future
-        for fom, conf in self.figures_of_merit.items():
-            log_path = expander.expand_var(conf['log_file'])
-            if log_path not in files and os.path.exists(log_path):
-                files[log_path] = {'contexts': [], 'foms': []}
+            for path in log_files[log_path]:
+                if path not in files:
+                    files[path] = {'contexts': [], 'foms': [],
+                                   'tail_kb': conf['tail_kb']}
 
-            if log_path in files:
-                tty.debug('Log = %s' % log_path)
+                tty.debug('Log = %s' % path)
                 tty.debug('Conf = %s' % conf)
                 if conf['contexts']:
-                    files[log_path]['contexts'].extend(conf['contexts'])
-                files[log_path]['foms'].append(fom)
-
-            foms[fom] = {
-                'regex': re.compile(r'%s' % conf['regex']),
-                'contexts': [],
-                'group': conf['group_name'],
-                'units': conf['units']
-            }
-            if conf['contexts']:
-                foms[fom]['contexts'].extend(conf['contexts'])
-
-            if conf['contexts']:
-                for context in conf['contexts']:
-                    regex_str = \
-                        self.figure_of_merit_contexts[context]['regex']
-                    format_str = \
-                        self.figure_of_merit_contexts[context]['output_format']
-                    contexts[context] = {
-                        'regex': re.compile(r'%s' % regex_str),
-                        'format': format_str
-                    }
+                    files[path]['contexts'].extend(conf['contexts'])
+                files[path]['foms'].append(fom)
+
+                # The whole file is read unless every FOM has a tail window
+                file_tail = files[path]['tail_kb']
+                if file_tail is not None:
+                    files[path]['tail_kb'] = None \
+                        if conf['tail_kb'] is None \
+                        else max(file_tail, conf['tail_kb'])
+
+            for context in conf['contexts']:
+                contexts[context] = \
+                    self.compiled_figure_of_merit_contexts[context]
         return files, contexts, foms
 
 
+def analysis_fingerprint(definitions_hash, files):
+    """Identify the inputs of an experiment's analysis
+
+    The fingerprint changes whenever the figure of merit definitions change,
+    or any of the analyzed files are added, removed, or modified.
+
+    Returns:
+        (dict): The definitions hash, and the (path, size, mtime, inode) of
+                every analyzed file
+    """
+    file_stats = []
+    for path in sorted(files.keys()):
+        path_stat = os.stat(path)
+        file_stats.append([path, path_stat.st_size, path_stat.st_mtime_ns,
+                           path_stat.st_ino])
+    return {'definitions': definitions_hash, 'files': file_stats}
+
+
+#: Maximum number of log files of an experiment scanned concurrently
+max_log_scan_threads = 8
+
+
+def _format_context(context_match, context_format):
+
+    keywords = {}
+    if isinstance(context_format, six.string_types):
+        for group in string.Formatter().parse(context_format):
+            if group[1]:
+                keywords[group[1]] = context_match[group[1]]
+
+    context_string = context_format.replace('{', '').replace('}', '') \
+        + ' = ' + context_format.format(**keywords)
+    return context_string
+
+
+def _scan_log_file(file, file_conf, contexts, foms, aggregated):
+    """Match the contexts and figures of merit of a single log file
+
+    Returns:
+        (tuple): The list of matches, in order, and the numeric values of
+                 aggregated figures of merit in each context. Matches are
+                 (context_name, None, None, None) for a context, and
+                 (None, fom, fom_contexts, value) for a figure of merit.
+    """
+    # Start with no active contexts in a file.
+    active_contexts = {}
+    matches = []
+    file_samples = {}
+    tty.debug('Reading log file: %s' % file)
+
+    # All regexes of the file are matched in a single pass over each
+    # line. Contexts are matched before figures of merit, so a figure of
+    # merit is attributed to a context starting on the same line.
+    file_contexts = []
+    for context in file_conf['contexts']:
+        if context not in file_contexts:
+            file_contexts.append(context)
+    file_foms = [fom for fom in file_conf['foms']
+                 if foms[fom]['group'] in foms[fom]['regex'].groupindex]
+    scanner = ramble.fom_scanner.line_scanner(tuple(
+        [contexts[context]['regex'].pattern for context in file_contexts] +
+        [foms[fom]['regex'].pattern for fom in file_foms]))
+    n_contexts = len(file_contexts)
+
+    tail = None
+    if file_conf['tail_kb'] is not None:
+        tail = int(file_conf['tail_kb'] * 1024)
+
+    for idx, match in scanner.scan_file(file, tail=tail):
+        if idx < n_contexts:
+            context = file_contexts[idx]
+            context_name = \
+                _format_context(match, contexts[context]['format'])
+            tty.debug('Line was: %s' % match.string)
+            tty.debug(' Context match %s -- %s' %
+                      (context, context_name))
+
+            active_contexts[context] = context_name
+            matches.append((context_name, None, None, None))
+            continue
+
+        fom = file_foms[idx - n_contexts]
+        fom_conf = foms[fom]
+        tty.debug(' --- Matched fom %s' % fom)
+        fom_val = match.group(fom_conf['group'])
+        number = fom_val
+        if fom_conf['type'] is not None or fom in aggregated:
+            number = ramble.fom_aggregate.convert(
+                fom_val, fom_conf['type'] or 'float')
+            if number is None:
+                tty.debug(' --- Value %s is not a number' % fom_val)
+                if fom_conf['type'] is not None:
+                    continue
+            elif fom_conf['type'] is not None:
+                fom_val = number
+
+        fom_contexts = []
+        if fom_conf['contexts']:
+            for context in fom_conf['contexts']:
+                context_name = active_contexts[context] \
+                    if context in active_contexts \
+                    else 'null'
+                fom_contexts.append(context_name)
+        else:
+            fom_contexts.append('null')
+
+        if not fom_conf['aggregate_only']:
+            matches.append((None, fom, fom_contexts, fom_val))
+
+        if fom in aggregated and number is not None:
+            for context in fom_contexts:
+                context_samples = file_samples.setdefault(context, {})
+                if fom not in context_samples:
+                    context_samples[fom] = ramble.fom_aggregate.new_samples()
+                context_samples[fom].append(number)
+
+    return matches, file_samples
+
+
+def analyze_experiment_logs(exp_ns, variables, files, contexts, foms,
+                            aggregates=None):
+    """Extract the figures of merit of a single experiment
+
+    The application is not available here, only the compiled context and
+    figure of merit definitions from its _analysis_dicts.
+
+    This builds up the fom_values dictionary. Its structure is:
+
+    fom_values[context][fom]
+
+    A fom can show up in multiple contexts.
+
+    Args:
+        exp_ns (str): Namespace of the experiment
+        variables (dict): Expanded variables recorded on success
+        files, contexts, foms: As returned by ApplicationBase._analysis_dicts
+        aggregates (dict): Aggregate figures of merit, as defined by the
+                           figure_of_merit_aggregate directive
+
+    Returns:
+        (dict): The experiment's results, keyed by exp_ns
+    """
+
+    fom_values = {}
+
+    # Every numeric value of an aggregated fom, in each context
+    aggregates = aggregates or {}
+    aggregated = set(conf['fom'] for conf in aggregates.values())
+    samples = {}
+
+    def scan(file_item):
+        file, file_conf = file_item
+        return _scan_log_file(file, file_conf, contexts, foms, aggregated)
+
+    # Files are scanned concurrently, but their matches are merged in order,
+    # exactly as if they were scanned one after another.
+    file_items = list(files.items())
+    if len(file_items) > 1 and max_log_scan_threads > 1:
+        n_threads = min(max_log_scan_threads, len(file_items))
+        with concurrent.futures.ThreadPoolExecutor(n_threads) as executor:
+            scanned = list(executor.map(scan, file_items))
+    else:
+        scanned = [scan(file_item) for file_item in file_items]
+
+    for matches, file_samples in scanned:
+        for context_name, fom, fom_contexts, fom_val in matches:
+            if fom is None:
+                fom_values[context_name] = {}
+                continue
+
+            for context in fom_contexts:
+                if context not in fom_values:
+                    fom_values[context] = {}
+                fom_values[context][fom] = {
+                    'value': fom_val,
+                    'units': foms[fom]['units']
+                }
+
+        for context, context_samples in file_samples.items():
+            for fom, values in context_samples.items():
+                if fom in samples.setdefault(context, {}):
+                    samples[context][fom].extend(values)
+                else:
+                    samples[context][fom] = values
+
+    for context, context_samples in samples.items():
+        for name, conf in aggregates.items():
+            if conf['fom'] not in context_samples:
+                continue
+            fom_conf = foms[conf['fom']]
+            units = conf['units']
+            if units is None:
+                units = ramble.fom_aggregate.statistic_units(
+                    conf['statistic'], fom_conf['units'])
+            fom_values.setdefault(context, {})[name] = {
+                'value': ramble.fom_aggregate.aggregate(
+                    conf['statistic'], context_samples[conf['fom']],
+                    fom_conf['type']),
+                'units': units
+            }
+
+    results = {}
+    results[exp_ns] = {}
+
+    tty.debug('fom_vals = %s' % fom_values)
+    if fom_values:
+        results[exp_ns]['RAMBLE_STATUS'] = 'SUCCESS'
+        results[exp_ns]['RAMBLE_VARIABLES'] = variables
+        results[exp_ns]['CONTEXTS'] = {}
+
+        for context, foms in fom_values.items():
+            results[exp_ns]['CONTEXTS'][context] = foms.copy()
+
+    else:
+        results[exp_ns]['RAMBLE_STATUS'] = 'FAILED'
+
+    return results
+
+
+#: Name of the manifest recording the rendered files of an experiment
+experiment_manifest_file = '.ramble_manifest.json'
+
+
+def _file_digest(path):
+    """Return the sha256 of the contents of path, or None if it is missing"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def render_experiment_templates(experiment_run_dir, expansions, templates,
+                                submit_template):
+    """Expand and write the templates of a single experiment
+
+    Templates are expanded from a snapshot of the experiment's variables,
+    rather than from a live Expander.
+
+    A manifest in the experiment directory records a hash of the inputs
+    (variables and templates), and of every rendered file. If the inputs and
+    the files on disk are unchanged the templates are not rendered again, and
+    otherwise only files whose content differs are rewritten.
+
+    Args:
+        experiment_run_dir (str): Directory of the experiment
+        expansions (dict): Variables captured with Expander.snapshot_vars
+        templates (list): Tuples of (output path, template contents)
+        submit_template (str): Template of the all_experiments script line
+
+    Returns:
+        (tuple): The experiment's line for the all_experiments script, and
+                 whether the experiment was 'created', 'updated', or
+                 'unchanged'
+    """
+    manifest_path = os.path.join(experiment_run_dir, experiment_manifest_file)
+
+    inputs = json.dumps([expansions, templates, submit_template],
+                        sort_keys=True, default=str)
+    inputs_hash = hashlib.sha256(inputs.encode('utf-8')).hexdigest()
+
+    manifest = None
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except ValueError:
+            manifest = None
+
+    # Files edited or removed since they were rendered are rendered again
+    old_files = manifest.get('files', {}) if manifest else {}
+    if manifest and manifest.get('inputs') == inputs_hash and \
+            all(_file_digest(path) == old_files.get(os.path.basename(path))
+                for path, _ in templates):
+        return manifest['submit'], 'unchanged'
+
+    rendered = ramble.expander.expand_templates(
+        expansions, [template_val for _, template_val in templates] +
+        [submit_template])
+
+    files = {}
+    changed = False
+    for (expand_path, _), template_out in zip(templates, rendered):
+        digest = hashlib.sha256(template_out.encode('utf-8')).hexdigest()
+        files[os.path.basename(expand_path)] = digest
+
+        if old_files.get(os.path.basename(expand_path)) == digest and \
+                _file_digest(expand_path) == digest:
+            continue
+
+        changed = True
+        with open(expand_path, 'w+') as f:
+            f.write(template_out)
+        os.chmod(expand_path, stat.S_IRWXU | stat.S_IRWXG
+                 | stat.S_IROTH | stat.S_IXOTH)
+
+    submit = rendered[-1]
+    with open(manifest_path, 'w') as f:
+        json.dump({'inputs': inputs_hash, 'files': files, 'submit': submit}, f)
+
+    if manifest is None:
+        status = 'created'
+    elif changed or manifest.get('submit') != submit:
+        status = 'updated'
+    else:
+        status = 'unchanged'
+    return submit, status
+
+
 class ApplicationError(RambleError):
     """
     Exception that is raised by applications
@@ -59,6 +59,36 @@ def tags():
         help='filter a package query by tags')
 
 
+@arg
+def where():
+    return Args(
+        '--where', dest='where', default=None, metavar='EXPRESSION',
+        help='only operate on experiments whose variables satisfy ' +
+             'EXPRESSION, e.g. "n_nodes >= 64 and partition == \'part2\'"')
+
+
+@arg
+def jobs():
+    return Args(
+        '-j', '--jobs', dest='jobs', type=int, default=1, metavar='N',
+        help='number of worker processes to use (default: 1)')
+
+
+@arg
+def timing():
+    return Args(
+        '--timing', action='store_true', default=False,
+        help='write the time spent in each phase of each experiment to a ' +
+             'JSON report in the workspace log directory')
+
+
+@arg
+def progress():
+    return Args(
+        '--progress', action='store_true', default=False,
+        help='show a progress bar of the experiments processed')
+
+
 @arg
 def application():
     return Args('application', help='application name')
@@ -0,0 +1,92 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+
+from __future__ import print_function
+
+import llnl.util.tty as tty
+
+import ramble.cmd
+import ramble.results
+
+description = "query the results of workspace analyses"
+section = "workspaces"
+level = "short"
+
+
+def setup_parser(subparser):
+    sp = subparser.add_subparsers(metavar='SUBCOMMAND',
+                                  dest='results_command')
+
+    query_parser = sp.add_parser('query', help=results_query.__doc__)
+    query_parser.add_argument(
+        '--fom', metavar='NAME',
+        help='only include this figure of merit')
+    for field in ramble.results.experiment_fields:
+        query_parser.add_argument(
+            '--%s' % field, metavar=field.upper(),
+            help='only include experiments with this %s' % field)
+    query_parser.add_argument(
+        '-v', '--variable', dest='variables', action='append',
+        metavar='NAME=VALUE', default=[],
+        help='only include experiments where variable NAME has VALUE. ' +
+             'May be given multiple times')
+    query_parser.add_argument(
+        '-g', '--group-by', dest='group_by', nargs='+', metavar='NAME',
+        default=[],
+        help='experiment fields (%s) or variables to show, and to group ' %
+             ', '.join(ramble.results.experiment_fields) +
+             'by when aggregating')
+    query_parser.add_argument(
+        '-a', '--aggregate', choices=ramble.results.aggregates,
+        help='aggregate the values of each figure of merit in each group')
+    query_parser.add_argument(
+        '--latest', action='store_true',
+        help='only include the most recent analysis')
+
+
+def _print_table(columns, rows):
+    rows = [['' if value is None else str(value) for value in row]
+            for row in rows]
+    widths = [max([len(column)] + [len(row[i]) for row in rows])
+              for i, column in enumerate(columns)]
+    for row in [columns] + rows:
+        print('  '.join(value.ljust(width)
+                        for value, width in zip(row, widths)).rstrip())
+
+
+def results_query(args):
+    """Query figures of merit across all analyses of a workspace"""
+    ws = ramble.cmd.require_active_workspace(cmd_name='results query')
+
+    variables = {}
+    for variable in args.variables:
+        name, sep, value = variable.partition('=')
+        if not sep:
+            tty.die('Variable filters must be NAME=VALUE, not %s' % variable)
+        variables[name] = value
+
+    fields = dict((field, getattr(args, field))
+                  for field in ramble.results.experiment_fields)
+
+    try:
+        columns, rows = ws.results_database.query(
+            fom=args.fom, variables=variables, group_by=args.group_by,
+            aggregate=args.aggregate, latest=args.latest, **fields)
+    except ramble.results.ResultsDatabaseError as e:
+        tty.die(e)
+
+    if not rows:
+        tty.msg('No results found')
+        return
+
+    _print_table(columns, rows)
+
+
+def results(parser, args):
+    action = {'query': results_query}
+    action[args.results_command](args)
@@ -25,6 +25,7 @@ import ramble.cmd.common.arguments as arguments
 import ramble.workspace
 import ramble.workspace.shell
 import ramble.expander
+import ramble.results
 
 if sys.version_info >= (3, 3):
     from collections.abc import Sequence  # novm noqa: F401
@@ -309,16 +310,33 @@ def workspace_setup_setup_parser(subparser):
              'all scripts. Prints commands that would be executed ' +
              'for installation, and files that would be downloaded.')
 
+    arguments.add_common_arguments(subparser, ['where', 'jobs', 'timing',
+                                               'progress'])
+
+
+def _experiment_filter(args):
+    """Build the experiment filter requested with --where, if any"""
+    if not args.where:
+        return None
+    try:
+        return ramble.expander.ExperimentFilter(args.where)
+    except ramble.expander.ExperimentFilterError as e:
+        tty.die(str(e))
+
 
 def workspace_setup(args):
     ws = ramble.cmd.require_active_workspace(cmd_name='workspace setup')
 
+    experiment_filter = _experiment_filter(args)
+
     if args.dry_run:
         ws.dry_run = True
 
     tty.debug('Setting up workspace')
     with ws.write_transaction():
-        ws.run_pipeline('setup')
+        ws.run_pipeline('setup', experiment_filter=experiment_filter,
+                        jobs=args.jobs, timing=args.timing,
+                        progress=args.progress)
 
 
 def workspace_analyze_setup_parser(subparser):
@@ -327,17 +345,36 @@ def workspace_analyze_setup_parser(subparser):
         '-f', '--formats', dest='output_formats',
         nargs='+',
         default=['text'],
-        help='list of output formats to write.' +
-             'Supported formats are json, yaml, or text',
+        help='list of output formats to write. ' +
+             'Supported formats are %s' %
+             ', '.join(ramble.results.output_formats.keys()),
         required=False)
 
+    subparser.add_argument(
+        '--table-variables', dest='table_variables',
+        nargs='+', metavar='VARIABLE',
+        default=None,
+        help='experiment variables to add as columns of the tabular ' +
+             'formats (csv and columns). Defaults to %s' %
+             ', '.join(ramble.results.default_table_variables),
+        required=False)
+
+    arguments.add_common_arguments(subparser, ['where', 'jobs', 'timing',
+                                               'progress'])
+
 
 def workspace_analyze(args):
     ws = ramble.cmd.require_active_workspace(cmd_name='workspace analyze')
+    experiment_filter = _experiment_filter(args)
+
+    if args.table_variables is not None:
+        ws.results_table_variables = args.table_variables
 
     tty.debug('Analyzing workspace')
     with ws.write_transaction():
-        ws.run_pipeline('analyze')
+        ws.run_pipeline('analyze', experiment_filter=experiment_filter,
+                        jobs=args.jobs, timing=args.timing,
+                        progress=args.progress)
         ws.dump_results(output_formats=args.output_formats)
 
 
@@ -430,7 +467,7 @@ def workspace_info(args):
                                  expander.experiment_name)
 
                     color.cprint(nested_4('        Experiment Parameters:'))
-                    rendered_vars = expander.get_level_vars(level='experiment')
+                    rendered_vars = expander.get_level_vars(level='experiment').copy()
                     if 'experiment_name' in rendered_vars:
                         del rendered_vars['experiment_name']
 
@@ -567,12 +604,16 @@ def workspace_archive_setup_parser(subparser):
         default=None,
         help='URL to upload tar archive into. Does nothing if `-t` is not specified.')
 
+    arguments.add_common_arguments(subparser, ['where'])
+
 
 def workspace_archive(args):
     ws = ramble.cmd.require_active_workspace(cmd_name='workspace archive')
+    experiment_filter = _experiment_filter(args)
 
     ws.archive(create_tar=args.tar_archive,
-               archive_url=args.upload_url)
+               archive_url=args.upload_url,
+               experiment_filter=experiment_filter)
 
 
 #: Dictionary mapping subcommand names and aliases to functions
@@ -7,13 +7,16 @@
 # except according to those terms.
 
 import os
+import re
 import math
 import string
 import ast
 import six
 import operator
-import itertools
+import functools
+import collections
 
+import llnl.util.lang
 import llnl.util.tty as tty
 
 import ramble.error
@@ -21,15 +24,450 @@ import ramble.error
 supported_math_operators = {
     ast.Add: operator.add, ast.Sub: operator.sub,
     ast.Mult: operator.mul, ast.Div: operator.truediv, ast.Pow:
-    operator.pow, ast.BitXor: operator.xor, ast.USub: operator.neg
+    operator.pow, ast.BitXor: operator.xor, ast.USub: operator.neg,
+    ast.UAdd: operator.pos, ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod
 }
 
+#: Comparisons are only evaluated in experiment filters, so variable values
+#: such as '3 == 3' are not rewritten when expanded
+supported_comparison_operators = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge
+}
+
+supported_math_functions = {
+    'min': min, 'max': max, 'ceil': math.ceil, 'floor': math.floor
+}
+
+#: Maximum number of distinct template strings kept compiled in memory
+template_cache_size = 16384
+
+#: Maximum number of evaluated math expressions kept in memory
+math_cache_size = 16384
+
+#: Characters that can appear in a supported math expression
+_math_chars_regex = re.compile(r'^[\s\w.+\-*/%^(),]+$')
+
+#: Names in a math expression (but not exponents of numbers like 1e5)
+_math_names_regex = re.compile(r'(?<![\w.])[A-Za-z_]\w*')
+
+#: Returned by evaluate_math for strings that are not math expressions
+not_math = object()
+
 
 class ExpansionDict(dict):
     def __missing__(self, key):
         return '{' + key + '}'
 
 
+class CompiledTemplate(object):
+    """A template string that has been tokenized for repeated rendering
+
+    The template is parsed with string.Formatter exactly once. The result is
+    a list of (literal_text, field_name) tokens, along with the keywords the
+    template depends on.
+
+    Templates where every field is a plain keyword are rendered by joining
+    their tokens directly. Templates using format specs, conversions, or
+    attribute / index lookups in a field fall back to str.format_map, to keep
+    its exact semantics.
+
+    If the template cannot be parsed, the keywords found before the parse
+    error are kept, and the error is stored to be raised when the template
+    is used.
+    """
+
+    __slots__ = ('template', 'tokens', 'keywords', 'simple', 'error')
+
+    def __init__(self, template):
+        self.template = template
+        self.tokens = []
+        self.simple = True
+        self.error = None
+
+        keywords = []
+        try:
+            for literal, field, spec, conversion in \
+                    string.Formatter().parse(template):
+                if field is not None:
+                    if spec or conversion or not _is_simple_field(field):
+                        self.simple = False
+                    if field:
+                        keywords.append(field)
+                self.tokens.append((literal, field))
+        except ValueError as e:
+            self.error = e
+
+        self.keywords = tuple(llnl.util.lang.dedupe(keywords))
+
+    def fully_expanded(self):
+        """Whether the template contains no keywords to expand"""
+        if self.keywords:
+            return False
+        if self.error:
+            raise self.error
+        return True
+
+    def render(self, values):
+        """Render the template against a dict of keyword values
+
+        Keywords not contained in values are left in place as '{keyword}'.
+        """
+        if self.error:
+            raise self.error
+
+        if not self.simple:
+            if not isinstance(values, ExpansionDict):
+                values = ExpansionDict(values)
+            return self.template.format_map(values)
+
+        parts = []
+        for literal, field in self.tokens:
+            parts.append(literal)
+            if field is not None:
+                if field in values:
+                    parts.append(format(values[field]))
+                else:
+                    parts.append('{' + field + '}')
+        return ''.join(parts)
+
+
+def _is_simple_field(field):
+    """Whether format_map would look a field up as a single mapping key"""
+    return field and not field.isdigit() and \
+        '.' not in field and '[' not in field
+
+
+@functools.lru_cache(maxsize=template_cache_size)
+def compile_template(template):
+    """Return the (cached) CompiledTemplate for a template string"""
+    return CompiledTemplate(template)
+
+
+def is_math_candidate(expr):
+    """Cheaply test if a string could be a supported math expression
+
+    Rejects strings containing characters which cannot be part of a math
+    expression, strings without any digits, and strings referring to names
+    other than the supported math functions. This avoids running ast.parse
+    on plain strings such as paths or commands.
+    """
+    if not _math_chars_regex.match(expr):
+        return False
+
+    if not any(c.isdigit() for c in expr):
+        return False
+
+    for name in _math_names_regex.findall(expr):
+        if name not in supported_math_functions:
+            return False
+    return True
+
+
+@functools.lru_cache(maxsize=math_cache_size)
+def evaluate_math(expr):
+    """Evaluate a string as a math expression
+
+    Returns:
+        The result of the expression, or not_math if expr is not a
+        supported math expression.
+    """
+    if not is_math_candidate(expr):
+        return not_math
+
+    try:
+        math_ast = ast.parse(expr, mode='eval')
+        return eval_math_node(math_ast.body)
+    except MathEvaluationError:
+        pass
+    except SyntaxError:
+        pass
+    return not_math
+
+
+def eval_math_node(node):
+    """Evaluate math from parsing the AST
+
+    Does not assume a specific type of operands.
+    Some operators will generate floating point, while
+    others will generate integers (if the inputs are integers).
+    """
+    if isinstance(node, ast.Num):
+        return node.n
+    elif isinstance(node, ast.BinOp):
+        left_eval = eval_math_node(node.left)
+        right_eval = eval_math_node(node.right)
+        op = _math_operator(node.op)
+        return op(left_eval, right_eval)
+    elif isinstance(node, ast.UnaryOp):
+        operand = eval_math_node(node.operand)
+        op = _math_operator(node.op)
+        return op(operand)
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or \
+                node.func.id not in supported_math_functions or \
+                node.keywords:
+            raise MathEvaluationError('Unsupported function call')
+        args = [eval_math_node(arg) for arg in node.args]
+        try:
+            return supported_math_functions[node.func.id](*args)
+        except TypeError as e:
+            raise MathEvaluationError('Invalid arguments to %s: %s' %
+                                      (node.func.id, e))
+    else:
+        raise MathEvaluationError('Invalid node')
+
+
+def _math_operator(op):
+    if type(op) not in supported_math_operators:
+        raise MathEvaluationError('Unsupported operator %s' %
+                                  type(op).__name__)
+    return supported_math_operators[type(op)]
+
+
+def variable_dependencies(val):
+    """Return the names of the variables a variable value refers to"""
+    if isinstance(val, six.string_types):
+        return compile_template(val).keywords
+    return ()
+
+
+def dependency_order(expansion_vars, roots, resolved_vars=None):
+    """Topologically order the variables needed to expand roots
+
+    Walks the dependency graph defined by the variable values in
+    expansion_vars, starting from the root variable names. Variables that
+    are not defined in expansion_vars, or which are already contained in
+    resolved_vars are not visited.
+
+    Returns:
+        (list): Variable names, ordered such that every variable comes after
+                all of the variables it depends on.
+
+    Raises:
+        VariableCycleError: if the variables reachable from roots contain a
+                            dependency cycle
+    """
+    if resolved_vars is None:
+        resolved_vars = {}
+
+    visiting = object()
+    done = object()
+
+    order = []
+    state = {}
+    for root in roots:
+        if root in resolved_vars or root not in expansion_vars or \
+                root in state:
+            continue
+
+        # Iterative depth first search, to support deep variable chains
+        path = [root]
+        stack = [iter(variable_dependencies(expansion_vars[root]))]
+        state[root] = visiting
+        while stack:
+            for dep in stack[-1]:
+                if dep in resolved_vars or dep not in expansion_vars:
+                    continue
+
+                dep_state = state.get(dep)
+                if dep_state is None:
+                    state[dep] = visiting
+                    path.append(dep)
+                    stack.append(
+                        iter(variable_dependencies(expansion_vars[dep])))
+                    break
+                elif dep_state is visiting:
+                    cycle = path[path.index(dep):] + [dep]
+                    raise VariableCycleError(
+                        'Variable dependency cycle detected: %s'
+                        % ' -> '.join(cycle))
+            else:
+                stack.pop()
+                var = path.pop()
+                state[var] = done
+                order.append(var)
+    return order
+
+
+class ExperimentSpace(object):
+    """The experiments defined by a set of vector and matrix variables
+
+    Experiments are not materialized. The variables for an experiment are
+    computed from its index with index arithmetic over the vector lengths,
+    so arbitrarily large sweeps can be iterated, counted, and sliced
+    without building every experiment up front.
+
+    The experiment order is the same as zipping all vectors, and crossing
+    each element with the (zipped) products of all matrices.
+    """
+
+    def __init__(self, vector_names, vectors, matrices):
+        """
+        Inputs:
+            - vector_names: (list) Names of the zipped vector variables
+            - vectors: (list) Values of the zipped vector variables. All are
+                       the same length.
+            - matrices: (list) Tuples of (variable names, vectors) for
+                        each matrix. Every matrix has the same size.
+        """
+        self.vector_names = vector_names
+        self.vectors = vectors
+        self.vector_size = len(vectors[0]) if vectors else 0
+
+        self.matrix_size = 0
+        if matrices:
+            self.matrix_size = 1
+            for vector in matrices[0][1]:
+                self.matrix_size *= len(vector)
+        self.matrices = matrices if self.matrix_size else []
+
+    def __len__(self):
+        if self.vector_names:
+            if self.matrices:
+                return self.vector_size * self.matrix_size
+            return self.vector_size
+        elif self.matrices:
+            return self.matrix_size
+        # A single experiment is rendered if everything is a scalar
+        return 1
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.experiment_vars(idx)
+
+    def __getitem__(self, idx):
+        return self.experiment_vars(idx)
+
+    def experiment_vars(self, idx):
+        """Return the dict of variables that define experiment idx"""
+        if idx < 0 or idx >= len(self):
+            raise IndexError('Experiment index %s out of range' % idx)
+
+        exp_vars = {}
+
+        matrix_idx = idx
+        if self.vector_names:
+            vector_idx = idx
+            if self.matrices:
+                vector_idx, matrix_idx = divmod(idx, self.matrix_size)
+
+            for name, vector in zip(self.vector_names, self.vectors):
+                exp_vars[name] = vector[vector_idx]
+
+        for names, vectors in self.matrices:
+            # Decompose the index the same way itertools.product orders
+            # its elements, with the last vector changing fastest.
+            values = [None] * len(vectors)
+            remainder = matrix_idx
+            for pos in reversed(range(len(vectors))):
+                remainder, elem_idx = divmod(remainder, len(vectors[pos]))
+                values[pos] = vectors[pos][elem_idx]
+
+            for name, value in zip(names, values):
+                exp_vars[name] = value
+
+        return exp_vars
+
+
+class ExperimentFilter(object):
+    """A predicate over experiment variables, such as `n_nodes >= 64`
+
+    Filter expressions support comparisons (including chained comparisons,
+    `in` and `not in`), `and`, `or`, `not`, arithmetic, and string or
+    numeric literals. Bare names refer to variables. These are expanded in
+    the current experiment context, and converted to numbers when possible.
+    """
+
+    _filter_nodes = (ast.Constant, ast.Name, ast.Load, ast.List, ast.Tuple,
+                     ast.Set, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not,
+                     ast.BinOp, ast.Compare, ast.operator, ast.unaryop, ast.cmpop)
+
+    _filter_operators = {ast.In: lambda a, b: a in b,
+                         ast.NotIn: lambda a, b: a not in b}
+
+    def __init__(self, expression):
+        self.expression = expression
+        try:
+            self._tree = ast.parse(expression.strip(), mode='eval').body
+        except SyntaxError as e:
+            raise ExperimentFilterError('Invalid filter expression "%s": %s' %
+                                        (expression, e.msg))
+
+        self.variables = []
+        for node in ast.walk(self._tree):
+            if not isinstance(node, self._filter_nodes):
+                raise ExperimentFilterError('Unsupported syntax in filter '
+                                            'expression "%s"' % expression)
+            if isinstance(node, ast.Name) and node.id not in self.variables:
+                self.variables.append(node.id)
+
+    def matches(self, expander, extra_vars=None):
+        """Evaluate the filter in the current context of expander"""
+        expansions = expander.get_expansion_dict(extra_vars)
+        values = {}
+        for var in self.variables:
+            if var not in expansions:
+                raise ExperimentFilterError('Variable %s used in filter expression '
+                                            '"%s" is not defined' %
+                                            (var, self.expression))
+            values[var] = self._filter_value(
+                expander.expand_var('{%s}' % var, extra_vars=extra_vars))
+
+        try:
+            return bool(self._eval(self._tree, values))
+        except (TypeError, ZeroDivisionError, MathEvaluationError) as e:
+            raise ExperimentFilterError('Cannot evaluate filter expression '
+                                        '"%s": %s' % (self.expression, e))
+
+    @staticmethod
+    def _filter_value(val):
+        for conv in (int, float):
+            try:
+                return conv(val)
+            except ValueError:
+                pass
+        return val
+
+    def _eval(self, node, values):
+        if isinstance(node, ast.Constant):
+            return node.value
+        elif isinstance(node, ast.Name):
+            return values[node.id]
+        elif isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return [self._eval(elt, values) for elt in node.elts]
+        elif isinstance(node, ast.BoolOp):
+            if isinstance(node.op, ast.And):
+                return all(self._eval(val, values) for val in node.values)
+            return any(self._eval(val, values) for val in node.values)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return not self._eval(node.operand, values)
+        elif isinstance(node, ast.UnaryOp):
+            return _math_operator(node.op)(self._eval(node.operand, values))
+        elif isinstance(node, ast.BinOp):
+            op = _math_operator(node.op)
+            return op(self._eval(node.left, values),
+                      self._eval(node.right, values))
+        elif isinstance(node, ast.Compare):
+            left_eval = self._eval(node.left, values)
+            for comparison, right in zip(node.ops, node.comparators):
+                right_eval = self._eval(right, values)
+                op = self._filter_operators.get(
+                    type(comparison),
+                    supported_comparison_operators.get(type(comparison)))
+                if op is None:
+                    raise ExperimentFilterError(
+                        'Unsupported comparison in filter expression "%s"' %
+                        self.expression)
+                if not op(left_eval, right_eval):
+                    return False
+                left_eval = right_eval
+            return True
+        raise ExperimentFilterError('Unsupported syntax in filter expression '
+                                    '"%s"' % self.expression)
+
+
 class Expander(object):
     """A class that will track and expand keyword arguments
 
@@ -67,18 +505,36 @@ class Expander(object):
     log_file_key = 'log_file'
     err_file_key = 'err_file'
 
+    _level_attrs = {
+        'application': 'application_vars',
+        'workload': 'workload_vars',
+        'experiment': 'experiment_vars'
+    }
+
     def __init__(self, workspace):
         self.current_level = 'base'
         self._workspace = workspace
 
         self._expansion_dict = None
 
+        # Scope levels whose variable dicts are still shared with the
+        # caller that provided them. These are copied on their first write.
+        self._shared_levels = set()
+
+        # Memoized expansions, valid for a single scope generation.
+        # The generation is bumped whenever any variable scope changes.
+        self._scope_generation = 0
+        self._resolved_generation = -1
+        self._resolved_vars = {}
+        self._resolved_strings = {}
+
         self.workspace_vars = self._workspace.get_workspace_vars().copy()
 
         self.application_vars = None
         self.workload_vars = None
         self.experiment_vars = None
         self.experiment_matrices = None
+        self.experiment_template = None
 
         self.workspace_env_vars = self._workspace.get_workspace_env_vars()
         self.workspace_env_vars = self.workspace_env_vars.copy() if \
@@ -95,36 +551,78 @@ class Expander(object):
         self.set_var(self.batch_submit_key,
                      self._workspace.batch_submit)
 
+    def _invalidate_expansions(self):
+        """Drop cached expansions after a variable scope has changed"""
+        self._expansion_dict = None
+        self._scope_generation += 1
+
+    def _resolution_tables(self):
+        """Return the memoized expansion tables for the current scopes
+
+        Returns a tuple of two dicts. The first maps variable names to their
+        fully resolved values, the second maps expanded template strings to
+        their final expansion. Both are reset whenever the scope generation
+        changes.
+        """
+        if self._resolved_generation != self._scope_generation:
+            self._resolved_vars = {}
+            self._resolved_strings = {}
+            self._resolved_generation = self._scope_generation
+        return self._resolved_vars, self._resolved_strings
+
     def get_level_vars(self, level=None):
         cur_level = self.current_level
         if level:
             cur_level = level
 
-        if cur_level == 'application':
-            return self.application_vars
-        elif cur_level == 'workload':
-            return self.workload_vars
-        elif cur_level == 'experiment':
-            return self.experiment_vars
+        if cur_level in self._level_attrs:
+            return getattr(self, self._level_attrs[cur_level])
         else:  # Default to returning the base_vars dict
             return self.base_vars
 
+    def _writable_level_vars(self, level=None):
+        """Return the variables of a level, copying them if still shared"""
+        cur_level = level if level else self.current_level
+
+        if cur_level in self._shared_levels:
+            self._shared_levels.remove(cur_level)
+            attr = self._level_attrs[cur_level]
+            setattr(self, attr, getattr(self, attr).copy())
+            self._invalidate_expansions()
+
+        return self.get_level_vars(level)
+
+    def _set_level_vars(self, level, level_vars):
+        """Set the variables of a level, without copying them
+
+        The dict is shared with the caller until the level is first written
+        to by set_var or remove_var.
+        """
+        attr = self._level_attrs[level]
+        if level_vars:
+            setattr(self, attr, level_vars)
+            self._shared_levels.add(level)
+        else:
+            setattr(self, attr, None)
+            self._shared_levels.discard(level)
+        self._invalidate_expansions()
+
     def set_var(self, var, val, level=None):
-        level_vars = self.get_level_vars(level)
+        level_vars = self._writable_level_vars(level)
 
         if level_vars is None:
             tty.die('Level variables for %s not defined yet' % level)
 
         level_vars[var] = val
-        self._expansion_dict = None
+        self._invalidate_expansions()
 
     def remove_var(self, var, level=None):
-        level_vars = self.get_level_vars(level)
+        level_vars = self._writable_level_vars(level)
 
         if var in level_vars:
             del level_vars[var]
 
-        self._expansion_dict = None
+        self._invalidate_expansions()
 
     def get_var(self, var, level=None):
         level_vars = self.get_level_vars(level)
@@ -136,13 +634,13 @@ class Expander(object):
 
     def set_package_path(self, package, path):
         self.package_paths['%s' % package] = path
-        self._expansion_dict = None
+        self._invalidate_expansions()
 
     def remove_package_path(self, package):
         key = '%s_path' % package
         if key in self.package_paths:
             del self.package_paths[key]
-        self._expansion_dict = None
+        self._invalidate_expansions()
 
     def get_package_path(self, package):
         key = '%s_path' % package
@@ -204,8 +702,8 @@ class Expander(object):
 
         self.remove_var(self.exp_name_key)
         self.remove_var(self.exp_run_dir_key)
-        self.workload_vars = None
-        self.experiment_vars = None
+        self._set_level_vars('workload', None)
+        self._set_level_vars('experiment', None)
 
     @property
     def workload_name(self):
@@ -245,6 +743,7 @@ class Expander(object):
             raise WorkloadNotDefinedError('Workload is not set correctly.')
 
         self.set_var(self.exp_name_key, exp_name)
+        self.experiment_template = exp_name
 
     """Finalize the setup of this experiment
 
@@ -281,14 +780,11 @@ class Expander(object):
                      os.path.join(self.experiment_run_dir,
                                   '%s.err' % self.experiment_name))
 
-    """Render experiments by processing vector and matrix variables.
+    """Build the space of experiments defined by vector and matrix variables.
 
     Interally collects all matrix and vector variables.
 
-    Before processing vectors and matrices, pull out vector spec_names, if they exist.
-    These are crossed with the remaining experiments.
-
-    Matrices are processed second.
+    Matrices are processed first.
     Vectors in the same matrix are crossed, sibling matrices are zipped.
     All matrices are required to result in the same number of elements, but not
     be the same shape.
@@ -301,20 +797,20 @@ class Expander(object):
     The resulting zip of vectors is then crossed with all of the matrices to
     build a final list of experiments.
 
-    After collecting the matrices, this method modifies the internal expander
-    data structures, and yields nothing. This allows the experiments to be
-    iterated over without having to perform the expansion again.
+    The experiments are not materialized. The returned ExperimentSpace
+    computes the variables of each experiment from its index on demand, and
+    knows the total number of experiments up front.
 
         Inputs:
             - extra_vars: (Dict) Extra variables to use when expanding variables
         Returns:
-            - Nothing.
+            - (ExperimentSpace) The experiments to render
     """
-    def rendered_experiments(self, extra_vars=None):
+    def experiment_space(self, extra_vars=None):
         all_expansions = self.get_expansion_dict(extra_vars)
 
-        experiments = []
-        matrix_experiments = []
+        matrix_vars = set()
+        matrices = []
 
         if self.experiment_matrices:
             """ Matrix syntax is:
@@ -335,9 +831,6 @@ class Expander(object):
 
             # Perform some error checking
             last_size = -1
-            matrix_vars = set()
-            matrix_vectors = []
-            matrix_variables = []
             for matrix in self.experiment_matrices:
                 matrix_size = 1
                 vectors = []
@@ -362,9 +855,6 @@ class Expander(object):
                     vectors.append(all_expansions[var])
                     variable_names.append(var)
 
-                    # Remove the variable, so it's not proccessed as a vector anymore.
-                    del all_expansions[var]
-
                 if last_size == -1:
                     last_size = matrix_size
 
@@ -372,71 +862,66 @@ class Expander(object):
                     tty.die('Matrices defined in experiment %s do not ' % self.experiment_name
                             + 'result in the same number of elements.')
 
-                matrix_vectors.append(vectors)
-                matrix_variables.append(variable_names)
-
-            # Create the empty initial dictionairies
-            matrix_experiments = []
-            for _ in range(matrix_size):
-                matrix_experiments.append({})
+                matrices.append((variable_names, vectors))
 
-            # Generate all of the exp var dicts
-            for names, vectors in zip(matrix_variables, matrix_vectors):
-                for exp_idx, entry in enumerate(itertools.product(*vectors)):
-                    for name_idx, name in enumerate(names):
-                        matrix_experiments[exp_idx][name] = entry[name_idx]
+        # After matrices have been processed, extract any remaining vector
+        # variables. Variables consumed by matrices are not vectors anymore.
+        vector_names = []
+        vectors = []
 
-        # After matrices have been processed, extract any remaining vector variables
-        vector_vars = {}
-
-        # Extract vector variables
         max_vector_size = 0
         for var, val in all_expansions.items():
-            if isinstance(val, list):
-                vector_vars[var] = val.copy()
+            if var not in matrix_vars and isinstance(val, list):
+                vector_names.append(var)
+                vectors.append(val)
                 max_vector_size = max(len(val), max_vector_size)
 
-        if vector_vars:
-            # Check that sizes are the same
-            for var, val in vector_vars.items():
-                if len(val) != max_vector_size:
-                    tty.die('Size of vector %s is not' % var
-                            + ' the same as max %s' % len(val)
-                            + '. In experiment %s' % self.experiment_name)
-
-            # Iterate over the vector length, and set the value in the
-            # experiment dict to the index value.
-            for i in range(0, max_vector_size):
-                exp_vars = {}
-                for var, val in vector_vars.items():
-                    exp_vars[var] = val[i]
-
-                if matrix_experiments:
-                    for matrix_experiment in matrix_experiments:
-                        for var, val in matrix_experiment.items():
-                            exp_vars[var] = val
-
-                        experiments.append(exp_vars.copy())
-                else:
-                    experiments.append(exp_vars.copy())
+        # Check that sizes are the same
+        for var, val in zip(vector_names, vectors):
+            if len(val) != max_vector_size:
+                tty.die('Size of vector %s is not' % var
+                        + ' the same as max %s' % len(val)
+                        + '. In experiment %s' % self.experiment_name)
 
-        elif matrix_experiments:
-            experiments = matrix_experiments
-        else:
-            # Ensure at least one experiment is rendered, if everything was a scalar
-            experiments.append({})
+        return ExperimentSpace(vector_names, vectors, matrices)
+
+    """Render experiments by processing vector and matrix variables.
+
+    Experiments are built by experiment_space, and are rendered one at a
+    time as this generator is iterated.
 
+    For each experiment, this method modifies the internal expander
+    data structures, and yields nothing. This allows the experiments to be
+    iterated over without having to perform the expansion again.
+
+    Experiments rejected by experiment_filter are skipped before they are
+    finalized.
+
+        Inputs:
+            - extra_vars: (Dict) Extra variables to use when expanding variables
+            - experiment_filter: (ExperimentFilter) Optional filter to select
+                                 experiments
+        Returns:
+            - Nothing.
+    """
+    def rendered_experiments(self, extra_vars=None, experiment_filter=None,
+                             on_skipped=None):
+        """Render every experiment of the current workload in turn
+
+        Yields once each experiment is set up in the expander. Experiments
+        that do not match experiment_filter are skipped, and their
+        namespaces are passed to on_skipped, if given.
+        """
         rendered_experiments = set()
-        for exp in experiments:
+        for exp in self._prepared_experiments(extra_vars):
             tty.debug('Rendering experiment:')
-            for var, val in exp.items():
-                self.set_var(var, val, level='experiment')
-            self.set_var(self.spack_key,
-                         os.path.join(self._workspace.software_dir,
-                                      '%s.%s' % ('{spec_name}', all_expansions[self.wl_name_key])),
-                         level='experiment')
+            if experiment_filter and \
+                    not experiment_filter.matches(self, extra_vars):
+                tty.debug('   Skipped by filter: %s' % exp)
+                if on_skipped:
+                    on_skipped(self.experiment_namespace)
+                continue
 
-            self._finalize_experiment()
             final_exp_name = self.expand_var('{' + self.exp_name_key + '}')
             tty.debug('   Exp vars: %s' % exp)
             tty.debug('   Final name: %s' % final_exp_name)
@@ -446,6 +931,49 @@ class Expander(object):
             rendered_experiments.add(final_exp_name)
             yield
 
+    def count_experiments(self, extra_vars=None, experiment_filter=None):
+        """Count the experiments of the current workload matching
+        experiment_filter
+
+        Without a filter, the experiment space is counted directly. Otherwise
+        experiments are prepared exactly as rendered_experiments does, so the
+        filter selects the same experiments.
+        """
+        if not experiment_filter:
+            return len(self.experiment_space(extra_vars))
+
+        return sum(1 for _ in self._prepared_experiments(extra_vars)
+                   if experiment_filter.matches(self, extra_vars))
+
+    def _prepared_experiments(self, extra_vars=None):
+        """Set up every experiment of the current workload in turn, ready to
+        be filtered
+
+        Yields the variables of each experiment, once they are set in the
+        expander, and the experiment is finalized, so filters can refer to
+        derived variables, such as n_nodes computed from n_ranks and
+        processes_per_node, or experiment_run_dir.
+        """
+        experiments = self.experiment_space(extra_vars)
+
+        workload_name = self.get_expansion_dict(extra_vars)[self.wl_name_key]
+        spack_env = os.path.join(self._workspace.software_dir,
+                                 '%s.%s' % ('{spec_name}', workload_name))
+
+        # Every experiment starts from the configured experiment variables, so
+        # variables derived for one experiment never leak into the next one.
+        exp_level_vars = dict(self.get_level_vars('experiment') or {})
+
+        for exp in experiments:
+            self._set_level_vars('experiment', exp_level_vars)
+            if not exp_level_vars:
+                self.experiment_vars = {}
+            for var, val in exp.items():
+                self.set_var(var, val, level='experiment')
+            self.set_var(self.spack_key, spack_env, level='experiment')
+            self._finalize_experiment()
+            yield exp
+
     def set_application_env_vars(self, application_env_vars):
         if application_env_vars:
             self.application_env_vars = application_env_vars.copy()
@@ -478,31 +1006,19 @@ class Expander(object):
                 yield var_set
 
     def set_application_vars(self, application_vars):
-        self._expansion_dict = None
-        if application_vars:
-            self.application_vars = application_vars.copy()
-        else:
-            self.application_vars = None
-        self.workload_vars = None
-        self.experiment_vars = None
+        self._set_level_vars('application', application_vars)
+        self._set_level_vars('workload', None)
+        self._set_level_vars('experiment', None)
 
     def set_workload_vars(self, workload_vars):
-        self._expansion_dict = None
-        if workload_vars:
-            self.workload_vars = workload_vars.copy()
-        else:
-            self.workload_vars = None
-        self.experiment_vars = None
+        self._set_level_vars('workload', workload_vars)
+        self._set_level_vars('experiment', None)
 
     def set_experiment_vars(self, experiment_vars):
-        self._expansion_dict = None
-        if experiment_vars:
-            self.experiment_vars = experiment_vars.copy()
-        else:
-            self.experiment_vars = None
+        self._set_level_vars('experiment', experiment_vars)
 
     def set_experiment_matrices(self, experiment_matrices):
-        self._expansion_dict = None
+        self._invalidate_expansions()
         if experiment_matrices:
             tty.debug('Setting matrices: %s' % experiment_matrices)
             self.experiment_matrices = experiment_matrices.copy()
@@ -515,23 +1031,17 @@ class Expander(object):
         n_nodes = self._find_key(self.nodes_key)
         n_threads = self._find_key(self.threads_key)
 
-        all_expansions = self.get_expansion_dict()
-
         if n_ranks:
-            n_ranks = int(self.expand_var(n_ranks,
-                                          all_expansions=all_expansions))
+            n_ranks = int(self.expand_var(n_ranks))
 
         if ppn:
-            ppn = int(self.expand_var(ppn,
-                                      all_expansions=all_expansions))
+            ppn = int(self.expand_var(ppn))
 
         if n_nodes:
-            n_nodes = int(self.expand_var(n_nodes,
-                                          all_expansions=all_expansions))
+            n_nodes = int(self.expand_var(n_nodes))
 
         if n_threads:
-            n_threads = int(self.expand_var(n_threads,
-                                            all_expansions=all_expansions))
+            n_threads = int(self.expand_var(n_threads))
 
         if n_ranks and ppn:
             test_n_nodes = math.ceil(int(n_ranks) / int(ppn))
@@ -543,38 +1053,25 @@ class Expander(object):
             elif not n_nodes:
                 tty.debug('Defining n_nodes in %s' %
                           self.experiment_namespace)
-                self.experiment_vars[self.nodes_key] = test_n_nodes
+                self.set_var(self.nodes_key, test_n_nodes, level='experiment')
         elif n_ranks and n_nodes:
             ppn = math.ceil(int(n_ranks) / int(n_nodes))
             tty.debug('Defining processes_per_node in %s' %
                       self.experiment_namespace)
-            self.experiment_vars[self.ppn_key] = ppn
+            self.set_var(self.ppn_key, ppn, level='experiment')
         elif ppn and n_nodes:
             n_ranks = ppn * n_nodes
             tty.debug('Defining n_ranks in %s' %
                       self.experiment_namespace)
-            self.experiment_vars[self.ranks_key] = n_ranks
+            self.set_var(self.ranks_key, n_ranks, level='experiment')
         elif not n_nodes:
-            self.experiment_vars[self.nodes_key] = 1
+            self.set_var(self.nodes_key, 1, level='experiment')
 
         if not n_threads:
-            self.experiment_vars[self.threads_key] = 1
+            self.set_var(self.threads_key, 1, level='experiment')
 
     def _find_key(self, key):
-        if self.experiment_vars and key in self.experiment_vars:
-            return self.experiment_vars[key]
-        elif self.workload_vars and key in self.workload_vars:
-            return self.workload_vars[key]
-        elif self.application_vars and key in self.application_vars:
-            return self.application_vars[key]
-        elif self.workspace_vars and key in self.workspace_vars:
-            return self.workspace_vars[key]
-        elif self.package_paths and key in self.package_paths:
-            return self.package_paths[key]
-        elif self.base_vars and key in self.base_vars:
-            return self.base_vars[key]
-        else:
-            return None
+        return self._get_base_expansion_dict().get(key, None)
 
     @property
     def n_ranks(self):
@@ -631,143 +1128,282 @@ class Expander(object):
         self.remove_var(self.exp_run_dir_key)
 
         self.pacakge_vars = {}
-        self.application_vars = None
-        self.workload_vars = None
-        self.experiment_vars = None
+        self._set_level_vars('application', None)
+        self._set_level_vars('workload', None)
+        self._set_level_vars('experiment', None)
         self.experiment_matrices = None
-        self._expansion_dict = None
 
         self.application_env_vars = None
         self.workload_env_vars = None
         self.experiment_env_vars = None
 
+    def _get_base_expansion_dict(self):
+        """Return the layered scope of all variables, without copying it
+
+        The scope is a ChainMap over the variable levels, from highest to
+        lowest precedence. It references the level dicts directly, so it is
+        cheap to build, and must not be modified by the caller.
+        """
+        if self._expansion_dict is None:
+            layers = [self.experiment_vars, self.workload_vars,
+                      self.application_vars, self.workspace_vars,
+                      self.package_paths, self.base_vars]
+            self._expansion_dict = \
+                collections.ChainMap(*[layer for layer in layers if layer])
+        return self._expansion_dict
+
     def get_expansion_dict(self, extra_vars=None):
-        """Return a dict of all vars that can be used for expansions"""
-        if not self._expansion_dict:
-            expansions = self.base_vars.copy()
-            if self.package_paths:
-                expansions.update(self.package_paths)
-            if self.workspace_vars:
-                expansions.update(self.workspace_vars)
-            if self.application_vars:
-                expansions.update(self.application_vars)
-            if self.workload_vars:
-                expansions.update(self.workload_vars)
-            if self.experiment_vars:
-                expansions.update(self.experiment_vars)
-
-            # Cache expansion dict up to here. The builtin expansion dict should not
-            # contain extra_vars
-            self._expansion_dict = expansions.copy()
-        else:
-            expansions = self._expansion_dict.copy()
+        """Return a dict of all vars that can be used for expansions
 
-        if extra_vars:
-            expansions.update(extra_vars)
+        The result is a child scope of the variable levels. Writes to it,
+        and extra_vars, only affect the child scope.
+        """
+        child_vars = dict(extra_vars) if extra_vars else {}
+        return self._get_base_expansion_dict().new_child(child_vars)
 
-        return expansions
+    def all_vars(self, extra_vars=None, names=None):
+        """Return a dict containing all expanded variables
 
-    def all_vars(self, extra_vars=None):
-        """Return a dict containing all expanded variables"""
+        If names is given, only the variables it contains are expanded and
+        returned.
+        """
 
-        expansions = self.get_expansion_dict(extra_vars)
+        if extra_vars:
+            expansions = self.get_expansion_dict(extra_vars)
+            resolved_vars = {}
+        else:
+            expansions = self._get_base_expansion_dict()
+            resolved_vars, _ = self._resolution_tables()
+
+        if names is None:
+            selected = list(expansions.keys())
+        else:
+            selected = [var for var in expansions.keys() if var in names]
+
+        # Resolve every variable once, in dependency order
+        self._resolve_vars(expansions, selected, resolved_vars)
 
         var_dict = {}
 
-        for var, val in expansions.items():
-            expanded_val = self.expand_var(val, all_expansions=expansions)
+        for var in selected:
+            val = expansions[var]
+            if isinstance(val, six.string_types):
+                expanded_val = str(resolved_vars[var]).lstrip()
+            else:
+                expanded_val = self._expand(expansions, val, resolved_vars)
             var_dict[var] = expanded_val
         return var_dict
 
+    def referenced_vars(self, templates, extra_vars=None):
+        """Return the set of variable names the templates depend on
+
+        Includes the variables referenced directly by the templates, and all
+        variables those refer to in the current context.
+        """
+        if extra_vars:
+            expansions = self.get_expansion_dict(extra_vars)
+        else:
+            expansions = self._get_base_expansion_dict()
+
+        roots = []
+        for template in templates:
+            roots.extend(variable_dependencies(template))
+
+        return set(dependency_order(expansions, roots))
+
+    def snapshot_vars(self, templates):
+        """Capture the variables needed to expand templates in a plain dict
+
+        The result only contains the (unexpanded) variables the templates
+        depend on, so it is small, and can be passed to expand_templates in
+        another process.
+        """
+        expansions = self._get_base_expansion_dict()
+        return dict((var, expansions[var])
+                    for var in self.referenced_vars(templates))
+
     def expand_var(self, var, extra_vars=None, all_expansions=None):
         """Perform expansion of a string
 
         Expand a string by building up a dict of all
         expansion variables.
+
+        When neither extra_vars nor all_expansions are given, the expansion
+        is memoized until the next change to any variable scope.
         """
-        if not all_expansions:
+        if all_expansions:
+            return self._expand(all_expansions, var, {})
+        elif extra_vars:
+            return self._expand(self.get_expansion_dict(extra_vars), var, {})
+
+        resolved_vars, resolved_strings = self._resolution_tables()
+        var_str = str(var)
+        if var_str not in resolved_strings:
+            resolved_strings[var_str] = \
+                self._expand(self._get_base_expansion_dict(), var_str,
+                             resolved_vars)
+        return resolved_strings[var_str]
+
+    def expand_many(self, templates, extra_vars=None):
+        """Expand a list of templates against the same variable context
+
+        The variable context is resolved once and shared by all templates, so
+        variables referenced by several templates are only expanded once.
+
+        Returns a list of the expanded templates, in the same order.
+        """
+        if extra_vars:
             expansions = self.get_expansion_dict(extra_vars)
+            resolved_vars = {}
+            resolved_strings = {}
         else:
-            expansions = all_expansions
-
-        expanded = self._partial_expand(expansions, str(var))
-
-        if self._fully_expanded(expanded):
-            try:
-                math_ast = ast.parse(str(expanded), mode='eval')
-                evaluated = self.eval_math(math_ast.body)
-                expanded = evaluated
-            except MathEvaluationError:
-                pass
-            except SyntaxError:
-                pass
-
-        return str(expanded).lstrip()
+            expansions = self._get_base_expansion_dict()
+            resolved_vars, resolved_strings = self._resolution_tables()
+
+        results = []
+        for template in templates:
+            template = str(template)
+            if template not in resolved_strings:
+                resolved_strings[template] = \
+                    self._expand(expansions, template, resolved_vars)
+            results.append(resolved_strings[template])
+        return results
+
+    def _expand(self, expansions, var, resolved_vars):
+        """Fully expand var, and evaluate it if it results in math"""
+        return expand_string(expansions, var, resolved_vars)
 
     def _all_keywords(self, in_str):
         if isinstance(in_str, six.string_types):
-            for keyword in string.Formatter().parse(in_str):
-                if keyword[1]:
-                    yield keyword[1]
+            template = compile_template(in_str)
+            for keyword in template.keywords:
+                yield keyword
+            if template.error:
+                raise template.error
 
     def _fully_expanded(self, in_str):
-        for kw in self._all_keywords(in_str):
-            return False
-        return True
+        return fully_expanded(in_str)
 
-    def eval_math(self, node):
-        """Evaluate math from parsing the AST
+    def _evaluate_math(self, val):
+        """Evaluate val as a math expression, if it is one
 
-        Does not assume a specific type of operands.
-        Some operators will generate floating point, while
-        others will generate integers (if the inputs are integers).
+        Returns the evaluated result, or val unmodified when it does not
+        contain a supported math expression.
         """
-        if isinstance(node, ast.Num):
-            return node.n
-        elif isinstance(node, ast.BinOp):
-            left_eval = self.eval_math(node.left)
-            right_eval = self.eval_math(node.right)
-            op = supported_math_operators[type(node.op)]
-            return op(left_eval, right_eval)
-        elif isinstance(node, ast.UnaryOp):
-            operand = self.eval_math(node.operand)
-            op = supported_math_operators[type(node.op)]
-            return op(operand)
-        else:
-            raise MathEvaluationError('Invalid node')
+        return evaluate_if_math(val)
 
-    def _partial_expand(self, expansion_vars, in_str):
+    def eval_math(self, node):
+        """Evaluate math from parsing the AST"""
+        return eval_math_node(node)
+
+    def _partial_expand(self, expansion_vars, in_str, resolved_vars=None):
         """Perform expansion of a string with some variables
 
         args:
           expansion_vars (dict): Variables to perform expansion with
           in_str (str): Input template string to expand
+          resolved_vars (dict): Memo of variables already expanded with
+                                expansion_vars. Filled in as variables
+                                are resolved.
 
         returns:
           in_str (str): Expanded version of input string
         """
+        return partial_expand(expansion_vars, in_str, resolved_vars)
+
+    def _resolve_vars(self, expansion_vars, names, resolved_vars):
+        """Resolve variables, and everything they depend on, in one pass"""
+        resolve_vars(expansion_vars, names, resolved_vars)
+
+
+def fully_expanded(in_str):
+    """Return True if in_str contains no variables left to expand"""
+    if isinstance(in_str, six.string_types):
+        return compile_template(in_str).fully_expanded()
+    return True
+
+
+def evaluate_if_math(val):
+    """Evaluate val as a math expression, if it is one
+
+    Returns the evaluated result, or val unmodified when it does not
+    contain a supported math expression.
+    """
+    evaluated = evaluate_math(str(val))
+    if evaluated is not_math:
+        return val
+    return evaluated
+
+
+def resolve_vars(expansion_vars, names, resolved_vars):
+    """Resolve variables, and everything they depend on, in one pass
+
+    Variables are ordered topologically with dependency_order, and then
+    evaluated in that order. This way each variable is expanded exactly
+    once, using the already resolved values of its dependencies.
+
+    args:
+      expansion_vars (dict): Variables to perform expansion with
+      names (list): Names of the variables to resolve
+      resolved_vars (dict): Resolved variable values. Updated in place.
+    """
+    for var in dependency_order(expansion_vars, names, resolved_vars):
+        val = expansion_vars[var]
+
+        if isinstance(val, six.string_types):
+            template = compile_template(val)
+            dep_vals = {}
+            for kw in template.keywords:
+                if kw in resolved_vars:
+                    dep_vals[kw] = resolved_vars[kw]
+            val = template.render(dep_vals)
+
+        if fully_expanded(val):
+            val = evaluate_if_math(val)
+
+        resolved_vars[var] = val
+
+
+def partial_expand(expansion_vars, in_str, resolved_vars=None):
+    """Expand the variables of in_str that are defined in expansion_vars"""
+    if resolved_vars is None:
+        resolved_vars = {}
+
+    if isinstance(in_str, six.string_types):
+        template = compile_template(in_str)
+        if template.error:
+            raise template.error
+
+        resolve_vars(expansion_vars, template.keywords, resolved_vars)
 
         exp_dict = ExpansionDict()
-        if isinstance(in_str, six.string_types):
-            for kw in self._all_keywords(in_str):
-                if kw in expansion_vars:
-                    exp_dict[kw] = \
-                        self._partial_expand(expansion_vars,
-                                             expansion_vars[kw])
-
-            for kw, val in exp_dict.items():
-                if self._fully_expanded(val):
-                    try:
-                        math_ast = ast.parse(str(val), mode='eval')
-                        evaluated = self.eval_math(math_ast.body)
-                        exp_dict[kw] = evaluated
-                    except MathEvaluationError:
-                        pass
-                    except SyntaxError:
-                        pass
-
-            return in_str.format_map(exp_dict)
-        return in_str
+        for kw in template.keywords:
+            if kw in resolved_vars:
+                exp_dict[kw] = resolved_vars[kw]
+
+        return template.render(exp_dict)
+    return in_str
+
+
+def expand_string(expansion_vars, var, resolved_vars=None):
+    """Fully expand var, and evaluate it if it results in math"""
+    expanded = partial_expand(expansion_vars, str(var), resolved_vars)
+
+    if fully_expanded(expanded):
+        expanded = evaluate_if_math(expanded)
+
+    return str(expanded).lstrip()
+
+
+def expand_templates(expansion_vars, templates):
+    """Expand a list of templates against a plain dict of variables
+
+    This does not require an Expander, so it can be used in worker
+    processes with the variables captured by Expander.snapshot_vars.
+    """
+    resolved_vars = {}
+    return [expand_string(expansion_vars, template, resolved_vars)
+            for template in templates]
 
 
 class ExpanderError(ramble.error.RambleError):
@@ -780,6 +1416,14 @@ class MathEvaluationError(ExpanderError):
     """
 
 
+class VariableCycleError(ExpanderError):
+    """Raised when variable definitions depend on each other in a cycle"""
+
+
+class ExperimentFilterError(ExpanderError):
+    """Raised when an experiment filter expression is invalid"""
+
+
 class ApplicationNotDefinedError(ExpanderError):
     """Raised when an application is not defined properly"""
 
@@ -0,0 +1,101 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+"""Typed figure of merit values, and statistics over them
+
+Figures of merit can declare a type, in which case their matched values
+are converted to numbers. Aggregate figures of merit reduce every value
+matched for another figure of merit, e.g. the time of every timestep on
+every rank, to a single statistic.
+
+While logs are scanned, the values of each aggregated figure of merit are
+accumulated in an array of doubles, which the statistics are computed over
+once all logs have been scanned.
+"""
+
+import array
+import math
+import re
+
+#: Conversions of the declared type of a figure of merit
+fom_types = {
+    'int': int,
+    'float': float
+}
+
+#: Statistics that can aggregate the values of a figure of merit. Any
+#: percentile can also be used, as pNN, e.g. p50 or p99.9
+statistics = ['min', 'max', 'sum', 'mean', 'stddev', 'count', 'balance']
+
+#: Statistics which do not have the units of the aggregated values
+unitless_statistics = ['count', 'balance']
+
+_percentile_re = re.compile(r'^p(?P<percent>[0-9]+(\.[0-9]*)?)$')
+
+
+def convert(value, fom_type):
+    """Convert a matched value to fom_type, or return None if it cannot be"""
+    try:
+        return fom_types[fom_type](value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_statistic(statistic):
+    """Whether statistic is a known statistic, or a valid percentile"""
+    if statistic in statistics:
+        return True
+    match = _percentile_re.match(statistic)
+    return bool(match) and float(match.group('percent')) <= 100
+
+
+def statistic_units(statistic, fom_units):
+    """Units of statistic, over values in fom_units"""
+    return '' if statistic in unitless_statistics else fom_units
+
+
+def new_samples():
+    """Return an empty array to accumulate the values of a figure of merit"""
+    return array.array('d')
+
+
+def aggregate(statistic, samples, fom_type=None):
+    """Compute statistic over samples
+
+    The standard deviation is that of the population of samples, and
+    percentiles are linearly interpolated between the nearest samples.
+    The balance is the mean divided by the maximum.
+
+    The minimum, maximum, and sum of int samples are ints. The count is
+    always an int, and other statistics are floats.
+    """
+    n = len(samples)
+    if statistic == 'count':
+        return n
+    if statistic == 'min':
+        value = min(samples)
+    elif statistic == 'max':
+        value = max(samples)
+    elif statistic == 'sum':
+        value = math.fsum(samples)
+    elif statistic == 'mean':
+        return math.fsum(samples) / n
+    elif statistic == 'stddev':
+        mean = math.fsum(samples) / n
+        return math.sqrt(math.fsum((x - mean) ** 2 for x in samples) / n)
+    elif statistic == 'balance':
+        top = max(samples)
+        return math.fsum(samples) / n / top if top else 0.0
+    else:
+        percent = float(_percentile_re.match(statistic).group('percent'))
+        ordered = sorted(samples)
+        rank = (n - 1) * percent / 100
+        low = int(rank)
+        high = min(low + 1, n - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+    return int(value) if fom_type == 'int' else value
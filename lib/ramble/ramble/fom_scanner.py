@@ -0,0 +1,293 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+"""Single pass matching of many regexes against the lines of a log file
+
+Applications can define dozens of context and figure of merit regexes for a
+single log file. Matching each of them separately against every line is
+slow for large logs, even though most lines match none of them.
+
+A LineScanner merges all of its regexes into one alternation, which rejects
+lines matching none of them in a single regex match. Lines it accepts are
+only fully matched against the regexes which can match them, based on a
+literal string each regex requires.
+
+Files are scanned line by line as they are read, rather than being read
+into memory all at once. When every regex requires a literal, large files
+are instead searched through a memory map for lines containing any of the
+literals, so the remaining lines are never decoded or handled in Python.
+"""
+
+import codecs
+import heapq
+import io
+import locale
+import mmap
+import os
+import re
+
+from llnl.util.lang import memoized
+
+try:
+    from re import _parser as sre_parse  # novm
+except ImportError:
+    import sre_parse
+
+
+#: Files, or tail windows of files, at least this large are scanned through
+#: a memory map
+mmap_threshold = 16 * 1024 * 1024
+
+#: Text encodings in which a memory mapped file can be split into lines, and
+#: decoded one line at a time
+_mappable_encodings = ('utf-8', 'ascii')
+
+
+class LineScanner(object):
+    """Match a list of regexes against lines, in a single pass per line
+
+    For any line, matches yields exactly the same (index, match) pairs, in
+    the same order, as calling regex.match(line) on every regex in turn.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._regexes = []
+        merged = []
+        self._unmerged = []
+        for i, pattern in enumerate(self.patterns):
+            self._regexes.append((i, re.compile(pattern),
+                                  _required_literal(pattern)))
+            alternative = _alternative(pattern)
+            if alternative is None:
+                self._unmerged.append(self._regexes[-1])
+            else:
+                merged.append(alternative)
+        self._combined = _combined_regex(merged)
+        self._file_literals = None
+        if self._regexes and all(literal for _, _, literal in self._regexes):
+            self._file_literals = _encoded_literals(
+                [literal for _, _, literal in self._regexes])
+        if self._combined is None:
+            self._unmerged = self._regexes
+
+    def matches(self, line):
+        """Yield (index, match) for each regex matching the start of line"""
+        candidates = self._regexes
+        if self._combined is not None and not self._combined.match(line):
+            # Only regexes outside of the combined regex can still match
+            candidates = self._unmerged
+
+        for i, regex, literal in candidates:
+            if literal and literal not in line:
+                continue
+            match = regex.match(line)
+            if match:
+                yield i, match
+
+    def scan_file(self, path, tail=None):
+        """Yield (index, match) for each regex matching each line of a file
+
+        The results are the same as those of matches, for every line of the
+        file opened in text mode. When tail is given, only lines starting
+        in the last tail bytes of the file are scanned.
+        """
+        size = os.path.getsize(path)
+        start = max(0, size - tail) if tail is not None else 0
+
+        if size and size - start >= mmap_threshold and \
+                self._file_literals is not None:
+            encoding = locale.getpreferredencoding(False)
+            if codecs.lookup(encoding).name in _mappable_encodings:
+                with open(path, 'rb') as f:
+                    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                with buf:
+                    # Text mode translates carriage returns to newlines
+                    if buf.find(b'\r', start) == -1:
+                        for item in self._scan_buffer(buf, start, encoding):
+                            yield item
+                        return
+
+        with open(path, 'rb') as f:
+            if start:
+                # Skip the line the window starts within
+                f.seek(start - 1)
+                f.readline()
+            for line in io.TextIOWrapper(f):
+                for item in self.matches(line):
+                    yield item
+
+    def _scan_buffer(self, buf, start, encoding):
+        """Scan only the lines of buf containing one of the literals"""
+        pos = start
+        if pos:
+            pos = buf.find(b'\n', pos - 1) + 1
+            if not pos:
+                return
+
+        # Next occurrence of each literal, from which the first is taken
+        found = []
+        for literal in self._file_literals:
+            at = buf.find(literal, pos)
+            if at != -1:
+                found.append((at, literal))
+        heapq.heapify(found)
+
+        end = len(buf)
+        while found:
+            at, literal = found[0]
+            if at < pos:
+                # Within a line which was already scanned
+                at = buf.find(literal, pos)
+                if at == -1:
+                    heapq.heappop(found)
+                else:
+                    heapq.heapreplace(found, (at, literal))
+                continue
+
+            line_start = buf.rfind(b'\n', pos, at) + 1 or pos
+            pos = buf.find(b'\n', at) + 1 or end
+            for item in self.matches(buf[line_start:pos].decode(encoding)):
+                yield item
+
+
+@memoized
+def line_scanner(patterns):
+    """Return a, possibly shared, LineScanner of a tuple of patterns"""
+    return LineScanner(patterns)
+
+
+def _parse(pattern):
+    try:
+        return sre_parse.parse(pattern)
+    except Exception:
+        return None
+
+
+def _flags(parsed):
+    # The parser state was named pattern before Python 3.8
+    state = getattr(parsed, 'state', None) or parsed.pattern
+    return state.flags
+
+
+def _subpatterns(av):
+    """Yield the sub-patterns in the arguments of a parsed op"""
+    if isinstance(av, sre_parse.SubPattern):
+        yield av
+    elif isinstance(av, (list, tuple)):
+        for item in av:
+            for sub in _subpatterns(item):
+                yield sub
+
+
+def _walk(parsed):
+    """Yield every (op, av) of a parsed pattern, including nested ones"""
+    for op, av in parsed:
+        yield op, av
+        for sub in _subpatterns(av):
+            for item in _walk(sub):
+                yield item
+
+
+def _literal_runs(parsed):
+    """Yield the literal strings every match of parsed must contain
+
+    Only consecutive literals at the top level of the pattern, or inside
+    groups at its top level, are considered. Anything repeated, optional,
+    or within a branch may not take part in a match.
+    """
+    run = []
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+
+        if run:
+            yield ''.join(run)
+            run = []
+
+        if op == sre_parse.SUBPATTERN:
+            # (group, add_flags, del_flags, pattern) since Python 3.6
+            if len(av) == 4 and av[1] & re.IGNORECASE:
+                continue
+            for sub_run in _literal_runs(av[-1]):
+                yield sub_run
+
+    if run:
+        yield ''.join(run)
+
+
+def _required_literal(pattern):
+    """Return the longest literal that any match of pattern contains
+
+    Returns an empty string if there is no such literal, or the pattern
+    cannot be analyzed.
+    """
+    parsed = _parse(pattern)
+    if parsed is None or _flags(parsed) & re.IGNORECASE:
+        return ''
+    return max(_literal_runs(parsed), key=len, default='')
+
+
+#: Named groups of a pattern. Escaped parentheses are not group openers.
+_named_group_re = re.compile(r'(?<!\\)\(\?P<\w+>')
+
+
+def _alternative(pattern):
+    """Return pattern rewritten as one alternative of a combined regex
+
+    Named groups are made non-capturing, as different patterns may reuse the
+    same group names. Returns None if pattern would change meaning when
+    merged with others, because it sets global flags or refers back to its
+    own groups, or if it cannot be rewritten safely.
+    """
+    parsed = _parse(pattern)
+    if parsed is None or _flags(parsed) & ~re.UNICODE:
+        return None
+    for op, _ in _walk(parsed):
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return None
+
+    # Every rewritten group opener must be an actual named group, and not,
+    # e.g., part of a character class.
+    rewritten, n_named = _named_group_re.subn('(?:', pattern)
+    regex = re.compile(pattern)
+    if n_named != len(regex.groupindex):
+        return None
+    try:
+        if re.compile(rewritten).groups != regex.groups - n_named:
+            return None
+    except re.error:
+        return None
+
+    return '(?:%s)' % rewritten
+
+
+def _combined_regex(alternatives):
+    """Merge alternatives into one regex matching where any of them matches
+
+    Returns None if there are less than two alternatives, as nothing would
+    be gained from merging them.
+    """
+    if len(alternatives) < 2:
+        return None
+    return re.compile('|'.join(alternatives))
+
+
+def _encoded_literals(literals):
+    """Return the distinct literals, encoded as UTF-8
+
+    Literals containing another one are left out, as every line containing
+    them also contains the shorter literal.
+    """
+    encoded = sorted(set(literal.encode('utf-8') for literal in literals),
+                     key=len)
+    distinct = []
+    for literal in encoded:
+        if not any(shorter in literal for shorter in distinct):
+            distinct.append(literal)
+    return distinct
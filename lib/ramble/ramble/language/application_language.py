@@ -6,6 +6,9 @@
 # option. This file may not be copied, modified, or distributed
 # except according to those terms.
 
+import re
+
+import ramble.fom_aggregate
 import ramble.language.language_base
 from ramble.language.language_base import DirectiveError
 
@@ -101,7 +104,8 @@ def executable(name, template, use_mpi=False, redirect='{log_file}', **kwargs):
     return _execute_executable
 
 
-@application_directive('figure_of_merit_contexts')
+@application_directive(('figure_of_merit_contexts',
+                        'compiled_figure_of_merit_contexts'))
 def figure_of_merit_context(name, regex, output_format):
     """Defines a context for figures of merit
 
@@ -121,6 +125,10 @@ def figure_of_merit_context(name, regex, output_format):
             'regex': regex,
             'output_format': output_format
         }
+        app.compiled_figure_of_merit_contexts[name] = {
+            'regex': re.compile(regex),
+            'format': output_format
+        }
 
     return _execute_figure_of_merit_context
 
@@ -143,34 +151,94 @@ def archive_pattern(pattern):
     return _execute_archive_pattern
 
 
-@application_directive('figures_of_merit')
+@application_directive(('figures_of_merit', 'compiled_figures_of_merit'))
 def figure_of_merit(name, log_file, fom_regex, group_name, units='',
-                    contexts=[]):
+                    contexts=[], tail_kb=None, fom_type=None,
+                    aggregate_only=False):
     """Adds a figure of merit to track for this application
 
     Defines a new figure of merit.
     Inputs:
      - name: High level name of the figure of merit
-     - log_file: File the figure of merit can be extracted from
+     - log_file: File the figure of merit can be extracted from. Can be a
+                 glob pattern, to extract it from every matching file
      - fom_regex: A regular expression using named groups to extract the FOM
      - group_name: The name of the group that the FOM should be pulled from
      - units: The units associated with the FOM
      - keep_policy: The policy for determining which FOM(s) to keep
                     can be 'last' or 'all'
+     - tail_kb: If set, the FOM only appears in the last tail_kb KB of the
+                log file. When every FOM of a log file sets this, only the
+                end of the file is read, so contexts printed before it are
+                not seen.
+     - fom_type: If set, values are converted to this type, 'int' or
+                 'float'. Values which cannot be converted are ignored.
+     - aggregate_only: If True, the values are only used by aggregate
+                       figures of merit, and are not reported in results
     """
 
+    if fom_type is not None and fom_type not in ramble.fom_aggregate.fom_types:
+        raise DirectiveError('figure_of_merit %s has fom_type %s, ' %
+                             (name, fom_type) + 'which must be one of: ' +
+                             ', '.join(ramble.fom_aggregate.fom_types))
+
     def _execute_figure_of_merit(app):
         app.figures_of_merit[name] = {
             'log_file': log_file,
             'regex': fom_regex,
             'group_name': group_name,
             'units': units,
-            'contexts': contexts
+            'contexts': contexts,
+            'tail_kb': tail_kb,
+            'fom_type': fom_type,
+            'aggregate_only': aggregate_only
+        }
+        app.compiled_figures_of_merit[name] = {
+            'regex': re.compile(fom_regex),
+            'contexts': list(contexts),
+            'group': group_name,
+            'units': units,
+            'type': fom_type,
+            'aggregate_only': aggregate_only
         }
 
     return _execute_figure_of_merit
 
 
+@application_directive('figure_of_merit_aggregates')
+def figure_of_merit_aggregate(name, fom, statistic, units=None):
+    """Adds a figure of merit aggregating all values of another one
+
+    Every value of the figure of merit fom, matched in any of its log
+    files, contributes to the aggregate in the same context.
+
+    Inputs:
+     - name: High level name of the aggregate figure of merit
+     - fom: Name of the figure of merit to aggregate. Its values must be
+            numeric.
+     - statistic: One of 'min', 'max', 'sum', 'mean', 'stddev', 'count',
+                  'balance' (mean / max), or a percentile as 'pNN', e.g.
+                  'p50' or 'p99'
+     - units: The units of the aggregate. Defaults to the units of fom, or
+              none for 'count' and 'balance'.
+    """
+
+    if not ramble.fom_aggregate.is_statistic(statistic):
+        raise DirectiveError('figure_of_merit_aggregate %s has unknown ' % name +
+                             'statistic %s. Statistics are: ' % statistic +
+                             ', '.join(ramble.fom_aggregate.statistics) +
+                             ', or a percentile, pNN')
+
+    def _execute_figure_of_merit_aggregate(app):
+        app.figure_of_merit_aggregates[name] = {
+            'fom': fom,
+            'statistic': statistic,
+            'units': units
+        }
+
+    return _execute_figure_of_merit_aggregate
+
+
 @application_directive('inputs')
 def input_file(name, url, description, target_dir='{workload_name}', **kwargs):
     """Adds an input file defintion to this appliaction
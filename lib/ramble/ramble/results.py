@@ -0,0 +1,530 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+"""Streaming storage and output formats of experiment results
+
+While a workspace is analyzed, the results of each experiment are appended
+to a JSON Lines stream as soon as they are available. Every line of the
+stream is a JSON object with a single key, the experiment namespace, mapped
+to the experiment's results.
+
+The output formats are written from the stream one experiment at a time, so
+memory use does not grow with the number of experiments. Besides the nested
+text, json, and yaml formats, results can be written as tables with one row
+per figure of merit, either as csv or in a compact binary columnar format
+which can be loaded with read_columns.
+
+Every analysis of a workspace is also recorded in a ResultsDatabase, which
+can be queried across analyses.
+"""
+
+import array
+import collections
+import contextlib
+import csv
+import datetime
+import json
+import re
+import sqlite3
+import struct
+import sys
+import zlib
+
+import six
+
+import spack.util.spack_json as sjson
+import spack.util.spack_yaml as syaml
+
+import ramble.error
+
+
+class ResultsStream(object):
+    """Append-only JSON Lines file of experiment results"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w')
+
+    def append(self, result):
+        """Write result, a dict of {experiment namespace: results}"""
+        for exp, exp_results in result.items():
+            self._file.write(json.dumps({exp: exp_results}) + '\n')
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def records(self):
+        """Yield (experiment namespace, results) tuples from the stream"""
+        return read_records(self.path)
+
+
+def read_records(path):
+    """Yield (experiment namespace, results) tuples from a results stream"""
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for exp, exp_results in json.loads(line).items():
+                yield exp, exp_results
+
+
+def write_text(records, f):
+    for exp, results in records:
+        f.write('Experiment %s figures of merit:\n' % exp)
+        f.write('  Status = %s\n' % results['RAMBLE_STATUS'])
+        if results['RAMBLE_STATUS'] == 'SUCCESS':
+            for context, foms in results['CONTEXTS'].items():
+                f.write('  %s figures of merit:\n' % context)
+                for name, fom in foms.items():
+                    output = '%s = %s %s' % (name, fom['value'], fom['units'])
+                    f.write('    %s\n' % (output.strip()))
+
+
+def write_json(records, f):
+    # Matches the layout of sjson.dump on a dict of all records, with each
+    # record indented to its nesting level.
+    f.write('{')
+    sep = '\n'
+    for exp, results in records:
+        f.write('%s  %s: %s' % (sep, json.dumps(exp),
+                                sjson.dump(results).replace('\n', '\n  ')))
+        sep = ',\n'
+    if sep != '\n':
+        f.write('\n')
+    f.write('}')
+
+
+def write_yaml(records, f):
+    # Consecutive top level block mappings form a single mapping.
+    empty = True
+    for exp, results in records:
+        syaml.dump({exp: results}, stream=f)
+        empty = False
+    if empty:
+        syaml.dump({}, stream=f)
+
+
+def write_jsonl(records, f):
+    for exp, results in records:
+        f.write(json.dumps({exp: results}) + '\n')
+
+
+#: Columns of every row of the tabular formats. The experiment variables
+#: requested for the table follow them.
+table_columns = ['experiment', 'status', 'context', 'fom', 'value',
+                 'value_text', 'units']
+
+#: Experiment variables added to tables when none are requested
+default_table_variables = ['application_name', 'workload_name',
+                           'experiment_name', 'n_nodes', 'n_ranks',
+                           'processes_per_node', 'n_threads']
+
+
+#: Strings which are typed as ints, rather than floats
+_int_regex = re.compile(r'^\s*[+-]?\d+\s*$')
+
+
+def typed_value(value):
+    """Return value as an int or float, or None if it is not numeric
+
+    Numbers are returned unchanged. Strings are converted to an int only if
+    they are an integer literal, and to a float otherwise.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if not isinstance(value, six.string_types):
+        return None
+    if _int_regex.match(value):
+        return int(value)
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def result_rows(records, variables=None):
+    """Yield one row per (experiment, context, figure of merit)
+
+    Each row is a list of the values of table_columns, followed by the values
+    of variables. Numeric values are converted to int or float. Experiments
+    without figures of merit, such as failed experiments, yield a single row
+    with no context or figure of merit.
+    """
+    variables = list(variables or [])
+    for exp, results in records:
+        exp_vars = results.get('RAMBLE_VARIABLES', {})
+        var_values = []
+        for var in variables:
+            value = exp_vars.get(var, None)
+            typed = typed_value(value)
+            var_values.append(value if typed is None else typed)
+
+        status = results['RAMBLE_STATUS']
+        n_rows = 0
+        for context, foms in results.get('CONTEXTS', {}).items():
+            for name, fom in foms.items():
+                value = fom['value']
+                yield [exp, status, context, name, typed_value(value),
+                       str(value), fom['units']] + var_values
+                n_rows += 1
+
+        if not n_rows:
+            yield [exp, status, None, None, None, None, None] + var_values
+
+
+def write_csv(records, f, variables=None):
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(table_columns + list(variables or []))
+    for row in result_rows(records, variables):
+        writer.writerow(['' if value is None else value for value in row])
+
+
+#: Leading bytes of files in the columnar format
+columns_magic = b'RAMBLECOL'
+
+#: Version of the columnar format
+columns_version = 1
+
+#: Number of rows held in memory, and stored together, by write_columns
+columns_row_group_size = 65536
+
+
+def write_columns(records, f, variables=None):
+    """Write results in a compact binary columnar format
+
+    The file starts with columns_magic and a version byte, followed by row
+    groups of up to columns_row_group_size rows. Each row group is a JSON
+    header, prefixed by its length as a little endian uint32, listing the
+    number of rows and the name, type, and compressed size of each column.
+    The zlib compressed column data follows the header. Numeric columns are
+    stored as little endian float64 values, with NaN for missing values, and
+    all other columns as JSON lists. The file ends with an empty header.
+    """
+    names = table_columns + list(variables or [])
+
+    f.write(columns_magic + struct.pack('<B', columns_version))
+
+    group = []
+    n_groups = 0
+    for row in result_rows(records, variables):
+        group.append(row)
+        if len(group) == columns_row_group_size:
+            _write_row_group(f, names, group)
+            group = []
+            n_groups += 1
+
+    # An empty row group still records the columns of an empty table
+    if group or not n_groups:
+        _write_row_group(f, names, group)
+
+    f.write(struct.pack('<I', 0))
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _write_row_group(f, names, rows):
+    header = {'rows': len(rows), 'columns': []}
+    data = []
+    for i, name in enumerate(names):
+        column = [row[i] for row in rows]
+        if all(value is None or _is_number(value) for value in column):
+            column_type = 'float64'
+            values = array.array('d', [float('nan') if value is None
+                                       else value for value in column])
+            if sys.byteorder != 'little':
+                values.byteswap()
+            raw = values.tobytes()
+        else:
+            column_type = 'str'
+            raw = json.dumps([value if value is None else str(value)
+                              for value in column]).encode('utf-8')
+        raw = zlib.compress(raw)
+        header['columns'].append([name, column_type, len(raw)])
+        data.append(raw)
+
+    header = json.dumps(header).encode('utf-8')
+    f.write(struct.pack('<I', len(header)))
+    f.write(header)
+    for raw in data:
+        f.write(raw)
+
+
+def read_columns(path):
+    """Read a file written by write_columns
+
+    Returns:
+        (OrderedDict): Lists of values, keyed by column name. Missing numeric
+                       values are NaN, and missing strings are None. This can
+                       be passed directly to pandas.DataFrame.
+    """
+    columns = collections.OrderedDict()
+    with open(path, 'rb') as f:
+        magic = f.read(len(columns_magic) + 1)
+        if magic[:-1] != columns_magic or magic[-1:] != \
+                struct.pack('<B', columns_version):
+            raise ValueError('%s is not a version %s results columns file' %
+                             (path, columns_version))
+
+        while True:
+            header_len, = struct.unpack('<I', f.read(4))
+            if not header_len:
+                break
+            header = json.loads(f.read(header_len).decode('utf-8'))
+            for name, column_type, size in header['columns']:
+                raw = zlib.decompress(f.read(size))
+                if column_type == 'float64':
+                    values = array.array('d')
+                    values.frombytes(raw)
+                    if sys.byteorder != 'little':
+                        values.byteswap()
+                    values = values.tolist()
+                else:
+                    values = json.loads(raw.decode('utf-8'))
+                columns.setdefault(name, []).extend(values)
+    return columns
+
+
+#: Output format of results
+OutputFormat = collections.namedtuple(
+    'OutputFormat', ['extension', 'writer', 'binary', 'tabular'])
+
+#: Output formats of results, by name. Tabular writers accept the experiment
+#: variables to add as columns.
+output_formats = collections.OrderedDict([
+    ('text', OutputFormat('.txt', write_text, False, False)),
+    ('json', OutputFormat('.json', write_json, False, False)),
+    ('yaml', OutputFormat('.yaml', write_yaml, False, False)),
+    ('jsonl', OutputFormat('.jsonl', write_jsonl, False, False)),
+    ('csv', OutputFormat('.csv', write_csv, False, True)),
+    ('columns', OutputFormat('.columns', write_columns, True, True)),
+])
+
+
+#: Version of the results database schema
+database_version = 1
+
+_database_schema = """
+CREATE TABLE analyses (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE experiments (
+    id INTEGER PRIMARY KEY,
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id),
+    namespace TEXT NOT NULL,
+    application TEXT,
+    workload TEXT,
+    experiment TEXT,
+    status TEXT
+);
+CREATE TABLE variables (
+    experiment_id INTEGER NOT NULL REFERENCES experiments(id),
+    name TEXT NOT NULL,
+    value TEXT,
+    numeric_value REAL
+);
+CREATE TABLE foms (
+    id INTEGER PRIMARY KEY,
+    experiment_id INTEGER NOT NULL REFERENCES experiments(id),
+    context TEXT,
+    name TEXT NOT NULL,
+    value TEXT,
+    numeric_value REAL,
+    units TEXT
+);
+CREATE INDEX experiments_application ON experiments(application);
+CREATE INDEX experiments_workload ON experiments(workload);
+CREATE INDEX experiments_experiment ON experiments(experiment);
+CREATE INDEX experiments_analysis ON experiments(analysis_id);
+CREATE INDEX variables_experiment ON variables(experiment_id, name);
+CREATE INDEX variables_name ON variables(name, value);
+CREATE INDEX foms_experiment ON foms(experiment_id);
+CREATE INDEX foms_name ON foms(name);
+"""
+
+#: Experiment columns which can be filtered and grouped by in queries
+experiment_fields = ['application', 'workload', 'experiment', 'status']
+
+#: Aggregate functions supported by queries
+aggregates = ['min', 'max', 'avg', 'sum', 'count']
+
+
+class ResultsDatabase(object):
+    """SQLite store of the results of every analysis of a workspace
+
+    Each analysis records the status, variables, and figures of merit of
+    all of its experiments, so results can be compared across analyses
+    without reading the results files they were written to.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextlib.contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version == 0:
+                with conn:
+                    conn.executescript(_database_schema)
+                    conn.execute('PRAGMA user_version = %d' %
+                                 database_version)
+            elif version != database_version:
+                raise ResultsDatabaseError(
+                    'Results database %s has version %s, expected %s' %
+                    (self.path, version, database_version))
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_analysis(self, records, timestamp=None):
+        """Record an analysis of the (experiment namespace, results) records
+
+        Returns:
+            (int): The id of the new analysis
+        """
+        if timestamp is None:
+            timestamp = datetime.datetime.now().isoformat(' ')
+
+        with self._connection() as conn:
+            analysis_id = conn.execute(
+                'INSERT INTO analyses (timestamp) VALUES (?)',
+                (timestamp,)).lastrowid
+
+            for exp, results in records:
+                exp_vars = results.get('RAMBLE_VARIABLES', {})
+                names = exp.split('.', 2)
+                names += [None] * (3 - len(names))
+                exp_id = conn.execute(
+                    'INSERT INTO experiments (analysis_id, namespace, '
+                    'application, workload, experiment, status) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (analysis_id, exp,
+                     exp_vars.get('application_name', names[0]),
+                     exp_vars.get('workload_name', names[1]),
+                     exp_vars.get('experiment_name', names[2]),
+                     results['RAMBLE_STATUS'])).lastrowid
+
+                conn.executemany(
+                    'INSERT INTO variables VALUES (?, ?, ?, ?)',
+                    ((exp_id, name, str(value), typed_value(value))
+                     for name, value in exp_vars.items()))
+
+                conn.executemany(
+                    'INSERT INTO foms (experiment_id, context, name, value, '
+                    'numeric_value, units) VALUES (?, ?, ?, ?, ?, ?)',
+                    ((exp_id, context, name, str(fom['value']),
+                      typed_value(fom['value']), fom['units'])
+                     for context, foms in results.get('CONTEXTS', {}).items()
+                     for name, fom in foms.items()))
+
+        return analysis_id
+
+    def query(self, fom=None, variables=None, group_by=None, aggregate=None,
+              latest=False, **fields):
+        """Query figures of merit across analyses
+
+        Arguments:
+            fom (str): Only include this figure of merit
+            variables (dict): Only include experiments with these values of
+                              experiment variables
+            group_by (list): Experiment fields or variables to add as
+                             columns, and to group by when aggregating
+            aggregate (str): Aggregate function applied to the numeric
+                             values of each group, one of aggregates
+            latest (bool): Only include the most recent analysis
+            fields: Only include experiments with these values of
+                    experiment_fields
+
+        Returns:
+            (tuple): The column names, and a list of rows
+        """
+        if aggregate and aggregate not in aggregates:
+            raise ResultsDatabaseError(
+                'Unknown aggregate %s, expected one of %s' %
+                (aggregate, ', '.join(aggregates)))
+
+        joins = []
+        where = []
+        params = []
+        group_exprs = []
+        order_exprs = []
+
+        for i, name in enumerate(group_by or []):
+            if name in experiment_fields:
+                group_exprs.append('e.%s' % name)
+                order_exprs.append('e.%s' % name)
+            else:
+                joins.append('LEFT JOIN variables g%d ON g%d.experiment_id = '
+                             'e.id AND g%d.name = ?' % (i, i, i))
+                params.append(name)
+                group_exprs.append('g%d.value' % i)
+                order_exprs.extend(['g%d.numeric_value' % i, 'g%d.value' % i])
+
+        for i, (name, value) in enumerate(sorted((variables or {}).items())):
+            joins.append('JOIN variables w%d ON w%d.experiment_id = e.id AND '
+                         'w%d.name = ? AND w%d.value = ?' % (i, i, i, i))
+            params.extend([name, str(value)])
+
+        for name, value in sorted(fields.items()):
+            if name not in experiment_fields:
+                raise ResultsDatabaseError('Unknown experiment field %s' %
+                                           name)
+            if value is not None:
+                where.append('e.%s = ?' % name)
+                params.append(value)
+
+        if fom is not None:
+            where.append('f.name = ?')
+            params.append(fom)
+
+        if latest:
+            where.append('e.analysis_id = (SELECT MAX(id) FROM analyses)')
+
+        group_names = list(group_by or [])
+        if aggregate:
+            where.append('f.name IS NOT NULL')
+            columns = group_names + ['fom', aggregate, 'units']
+            select = group_exprs + ['f.name',
+                                    '%s(f.numeric_value)' % aggregate.upper(),
+                                    'f.units']
+            group = ' GROUP BY ' + ', '.join(
+                group_exprs + ['f.name', 'f.units'])
+            order = order_exprs + ['f.name']
+        else:
+            columns = ['analysis', 'timestamp', 'experiment', 'status',
+                       'context', 'fom', 'value', 'units'] + group_names
+            select = ['a.id', 'a.timestamp', 'e.namespace', 'e.status',
+                      'f.context', 'f.name', 'f.value', 'f.units'] + \
+                group_exprs
+            group = ''
+            order = ['a.id', 'e.id', 'f.id']
+
+        sql = ('SELECT %s FROM experiments e '
+               'JOIN analyses a ON e.analysis_id = a.id '
+               'LEFT JOIN foms f ON f.experiment_id = e.id ' %
+               ', '.join(select))
+        sql += ' '.join(joins)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += group + ' ORDER BY ' + ', '.join(order)
+
+        with self._connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return columns, rows
+
+
+class ResultsDatabaseError(ramble.error.RambleError):
+    """Raised when the results database cannot be used"""
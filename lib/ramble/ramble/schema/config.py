@@ -26,6 +26,17 @@ properties['config']['shell'] = {
     'enum': ['sh', 'bash', 'csh', 'tcsh', 'fish']
 }
 
+properties['config']['results_variables'] = {
+    'type': 'string',
+    'enum': ['all', 'referenced']
+}
+
+properties['config']['results_include_variables'] = {
+    'type': 'array',
+    'default': [],
+    'items': {'type': 'string'}
+}
+
 #: Full schema with metadata
 schema = {
     '$schema': 'http://json-schema.org/schema#',
@@ -344,6 +344,11 @@ def test_figure_of_merit_directive(app_class):
             assert app_inst.figures_of_merit[fom_name][conf_name] \
                 == conf_val
 
+        # Regexes are compiled once, when the directive is executed
+        compiled = app_inst.compiled_figures_of_merit[fom_name]
+        assert compiled['regex'].pattern == conf['regex']
+        assert compiled['group'] == conf['group_name']
+
 
 @pytest.mark.parametrize('app_class', app_types)
 def test_input_file_directive(app_class):
@@ -7,8 +7,12 @@
 # except according to those terms.
 """Perform tests of the Application class"""
 
+import re
+
 import pytest
 
+import ramble.application
+
 
 @pytest.mark.parametrize('app', [
     'basic'
@@ -162,3 +166,34 @@ def test_env_var_unset_command_gen(mutable_mock_repo):
     out_cmds, _ = basic_inst._get_env_unset_commands(tests, set())
     for cmd in answer:
         assert cmd in out_cmds
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_analyze_multiple_logs(tmpdir, monkeypatch, threads):
+    monkeypatch.setattr(ramble.application, 'max_log_scan_threads', threads)
+
+    files = {}
+    for rank in range(6):
+        log = tmpdir.join('rank.%s' % rank)
+        log.write('Step 1\ntime %s\nStep 2\ntime %s.5\n' % (rank, rank))
+        files[str(log)] = {'contexts': ['step'], 'foms': ['time'],
+                           'tail_kb': None}
+    contexts = {'step': {'regex': re.compile(r'Step (?P<step>\d+)'),
+                         'format': '{step}'}}
+    foms = {'time': {'regex': re.compile(r'time (?P<t>\S+)'),
+                     'contexts': ['step'], 'group': 't', 'units': 's',
+                     'type': 'float', 'aggregate_only': False}}
+    aggregates = {'total': {'fom': 'time', 'statistic': 'sum',
+                            'units': None}}
+
+    results = ramble.application.analyze_experiment_logs(
+        'exp', {}, files, contexts, foms, aggregates)
+
+    # Files are merged in order, so the last rank's values are kept, while
+    # aggregates include every rank
+    assert results['exp']['CONTEXTS'] == {
+        'step = 1': {'time': {'value': 5.0, 'units': 's'},
+                     'total': {'value': 15.0, 'units': 's'}},
+        'step = 2': {'time': {'value': 5.5, 'units': 's'},
+                     'total': {'value': 18.0, 'units': 's'}},
+    }
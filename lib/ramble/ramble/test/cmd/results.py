@@ -0,0 +1,95 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+
+import os
+
+import pytest
+
+import ramble.workspace
+from ramble.main import RambleCommand
+
+# everything here uses the mock_workspace_path
+pytestmark = pytest.mark.usefixtures(
+    'mutable_mock_workspace_path', 'config')
+
+workspace = RambleCommand('workspace')
+results = RambleCommand('results')
+
+
+def test_results_query():
+    test_config = """
+ramble:
+  mpi:
+    command: mpirun
+    args: []
+  batch:
+    submit: '{execute_experiment}'
+  variables:
+    processes_per_node: '1'
+    n_ranks: '1'
+  applications:
+    hostname:
+      workloads:
+        serial:
+          experiments:
+            test_{n_nodes}_{idx}:
+              variables:
+                n_nodes: ['1', '2']
+                idx: ['1', '2']
+              matrix:
+              - n_nodes
+              - idx
+spack:
+  concretized: true
+"""
+
+    workspace_name = 'test_results_query'
+    with ramble.workspace.create(workspace_name) as ws:
+        ws.write()
+
+        config_path = os.path.join(ws.config_dir, ramble.workspace.config_file_name)
+        with open(config_path, 'w+') as f:
+            f.write(test_config)
+        ws._re_read()
+
+        workspace('setup', '--dry-run', global_args=['-w', workspace_name])
+
+        exp_base = os.path.join(ws.experiment_dir, 'hostname', 'serial')
+
+        def analyze(offset):
+            for n_nodes in range(1, 3):
+                for idx in range(1, 3):
+                    exp_name = 'test_%s_%s' % (n_nodes, idx)
+                    with open(os.path.join(exp_base, exp_name,
+                                           exp_name + '.out'), 'w+') as f:
+                        f.write('%s.5user 0.00system\n' %
+                                (10 * n_nodes + idx + offset))
+            workspace('analyze', global_args=['-w', workspace_name])
+
+        analyze(0)
+        analyze(100)
+
+        output = results('query', '--fom', 'user time', '--latest',
+                         global_args=['-w', workspace_name])
+        assert 'hostname.serial.test_2_1' in output
+        assert '121.5' in output
+        assert ' 21.5 ' not in output
+
+        output = results('query', '--fom', 'user time', '-g', 'n_nodes',
+                         '-a', 'min', global_args=['-w', workspace_name])
+        lines = output.strip().split('\n')
+        assert lines[0].split() == ['n_nodes', 'fom', 'min', 'units']
+        assert lines[1].split() == ['1', 'user', 'time', '11.5', 's']
+        assert lines[2].split() == ['2', 'user', 'time', '21.5', 's']
+
+        output = results('query', '--fom', 'user time', '-v', 'idx=2',
+                         '-g', 'n_nodes', '-a', 'count',
+                         global_args=['-w', workspace_name])
+        lines = output.strip().split('\n')
+        assert lines[1].split() == ['1', 'user', 'time', '2', 's']
+        assert lines[2].split() == ['2', 'user', 'time', '2', 's']
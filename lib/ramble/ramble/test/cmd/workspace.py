@@ -7,12 +7,16 @@
 # except according to those terms.
 
 import os
+import glob
 
 import pytest
 
 import llnl.util.filesystem as fs
 
+import spack.util.spack_json as sjson
+
 import ramble.workspace
+import ramble.expander
 from ramble.main import RambleCommand, RambleCommandError
 
 # everything here uses the mock_workspace_path
@@ -83,10 +87,13 @@ def check_info_basic(output):
 
 
 def check_results(ws):
-    fn = ws.dump_results(output_formats=['text', 'json', 'yaml'])
+    fn = ws.dump_results(output_formats=['text', 'json', 'yaml', 'csv',
+                                         'columns'])
     assert os.path.exists(os.path.join(ws.root, fn + '.txt'))
     assert os.path.exists(os.path.join(ws.root, fn + '.json'))
     assert os.path.exists(os.path.join(ws.root, fn + '.yaml'))
+    assert os.path.exists(os.path.join(ws.root, fn + '.csv'))
+    assert os.path.exists(os.path.join(ws.root, fn + '.columns'))
 
 
 def test_workspace_add():
@@ -505,6 +512,231 @@ spack:
                                        'execute_experiment'))
 
 
+def test_parallel_setup_matches_serial(monkeypatch):
+    test_config = """
+ramble:
+  mpi:
+    command: mpirun
+    args:
+    - '-n'
+    - '{n_ranks}'
+    - '-ppn'
+    - '{processes_per_node}'
+    - '-hostfile'
+    - 'hostfile'
+  batch:
+    submit: 'batch_submit {execute_experiment}'
+  variables:
+    processes_per_node: [2, 4]
+    n_ranks: '{processes_per_node}*{n_nodes}'
+  applications:
+    basic:
+      workloads:
+        test_wl:
+          experiments:
+            exp_{n_nodes}_{processes_per_node}:
+              variables:
+                n_nodes: [1, 2, 4, 8]
+              matrix:
+              - n_nodes
+spack:
+  concretized: true
+"""
+
+    workspace_name = 'test_parallel_setup'
+    ws1 = ramble.workspace.create(workspace_name)
+    ws1.write()
+
+    config_path = os.path.join(ws1.config_dir, ramble.workspace.config_file_name)
+
+    with open(config_path, 'w+') as f:
+        f.write(test_config)
+
+    ws1._re_read()
+
+    workspace_flags = ['-w', workspace_name]
+    all_experiments_path = os.path.join(ws1.root, 'all_experiments')
+    exp_base = os.path.join(ws1.experiment_dir, 'basic', 'test_wl')
+
+    def setup_outputs(*args):
+        workspace('setup', '--dry-run', *args, global_args=workspace_flags)
+        outputs = {}
+        with open(all_experiments_path, 'r') as f:
+            outputs['all_experiments'] = f.read()
+        for exp in os.listdir(exp_base):
+            exp_script = os.path.join(exp_base, exp, 'execute_experiment')
+            with open(exp_script, 'r') as f:
+                outputs[exp] = f.read()
+        return outputs
+
+    serial = setup_outputs()
+    assert len(serial) == 9
+    assert serial == setup_outputs('--jobs', '3')
+
+    # Only a few tasks per job are in flight at once
+    queued = []
+    run_experiment_task = ramble.workspace.Workspace._run_experiment_task
+
+    def counting_run_experiment_task(self, *args, **kwargs):
+        run_experiment_task(self, *args, **kwargs)
+        queued.append(len(self._experiment_tasks))
+
+    monkeypatch.setattr(ramble.workspace.workspace,
+                        'experiment_tasks_per_job', 1)
+    monkeypatch.setattr(ramble.workspace.Workspace, '_run_experiment_task',
+                        counting_run_experiment_task)
+    assert serial == setup_outputs('--jobs', '2')
+    assert len(queued) == 8
+    assert max(queued) <= 2
+
+
+def test_incremental_setup():
+    test_config = """
+ramble:
+  mpi:
+    command: mpirun
+    args: []
+  batch:
+    submit: 'batch_submit {execute_experiment}'
+  variables:
+    processes_per_node: '2'
+    n_ranks: '{processes_per_node}*{n_nodes}'
+  applications:
+    basic:
+      workloads:
+        test_wl:
+          experiments:
+            exp_{n_nodes}:
+              variables:
+                n_nodes: ['1', '2', '4']
+spack:
+  concretized: true
+"""
+
+    workspace_name = 'test_incremental_setup'
+    ws1 = ramble.workspace.create(workspace_name)
+    ws1.write()
+
+    config_path = os.path.join(ws1.config_dir, ramble.workspace.config_file_name)
+
+    with open(config_path, 'w+') as f:
+        f.write(test_config)
+
+    ws1._re_read()
+
+    workspace_flags = ['-w', workspace_name]
+    exp_script = os.path.join(ws1.experiment_dir, 'basic', 'test_wl',
+                              'exp_1', 'execute_experiment')
+
+    output = workspace('setup', '--dry-run', global_args=workspace_flags)
+    assert 'Experiments: 3 created, 0 updated, 0 unchanged' in output
+    first_stat = os.stat(exp_script)
+
+    output = workspace('setup', '--dry-run', global_args=workspace_flags)
+    assert 'Experiments: 0 created, 0 updated, 3 unchanged' in output
+    assert os.stat(exp_script).st_mtime_ns == first_stat.st_mtime_ns
+
+    # A modified template updates every experiment
+    template_path = os.path.join(ws1.config_dir, 'execute_experiment.tpl')
+    with open(template_path, 'a') as f:
+        f.write('\necho {n_ranks}\n')
+    ws1._re_read()
+
+    output = workspace('setup', '--dry-run', global_args=workspace_flags)
+    assert 'Experiments: 0 created, 3 updated, 0 unchanged' in output
+    with open(exp_script, 'r') as f:
+        assert 'echo 2' in f.read()
+
+    # A rendered file edited on disk is restored
+    with open(exp_script, 'r') as f:
+        rendered = f.read()
+    with open(exp_script, 'w') as f:
+        f.write(rendered[:10])
+
+    output = workspace('setup', '--dry-run', global_args=workspace_flags)
+    assert 'Experiments: 0 created, 1 updated, 2 unchanged' in output
+    with open(exp_script, 'r') as f:
+        assert f.read() == rendered
+
+
+def test_setup_timing(monkeypatch):
+    test_config = """
+ramble:
+  mpi:
+    command: mpirun
+    args: []
+  batch:
+    submit: 'batch_submit {execute_experiment}'
+  variables:
+    processes_per_node: '2'
+    n_ranks: '{processes_per_node}*{n_nodes}'
+  applications:
+    basic:
+      workloads:
+        test_wl:
+          experiments:
+            exp_{n_nodes}:
+              variables:
+                n_nodes: ['1', '2', '4']
+spack:
+  concretized: true
+"""
+
+    workspace_name = 'test_setup_timing'
+    ws1 = ramble.workspace.create(workspace_name)
+    ws1.write()
+
+    config_path = os.path.join(ws1.config_dir, ramble.workspace.config_file_name)
+
+    with open(config_path, 'w+') as f:
+        f.write(test_config)
+
+    ws1._re_read()
+
+    assert ws1._count_experiments() == 3
+    assert ws1._count_experiments(
+        ramble.expander.ExperimentFilter('n_nodes > 1')) == 2
+
+    workspace('setup', '--dry-run', '--timing', '--progress',
+              global_args=['-w', workspace_name])
+
+    timing_files = glob.glob(os.path.join(ws1.log_dir, 'timing.setup.*.json'))
+    assert len(timing_files) == 1
+    with open(timing_files[0], 'r') as f:
+        report = sjson.load(f)
+
+    assert report['pipeline'] == 'setup'
+    assert report['n_experiments'] == 3
+    assert [exp['name'] for exp in report['experiments']] == \
+        ['basic.test_wl.exp_1', 'basic.test_wl.exp_2', 'basic.test_wl.exp_4']
+    for exp in report['experiments']:
+        assert 'make_experiments' in exp['phases']
+    assert report['phases']['make_experiments']['count'] == 3
+    assert 'make_experiments' in report['applications']['basic']
+
+    # With multiple jobs, collecting the rendered experiments is timed as
+    # part of the phase that submitted them. Every reading of this clock is
+    # a second later than the previous one.
+    class Clock(object):
+        now = 0.0
+
+        def time(self):
+            self.now += 1.0
+            return self.now
+
+    monkeypatch.setattr(ramble.workspace.workspace, 'time', Clock())
+    for timing_file in timing_files:
+        os.remove(timing_file)
+    workspace('setup', '--dry-run', '--timing', '--jobs', '2',
+              global_args=['-w', workspace_name])
+
+    timing_files = glob.glob(os.path.join(ws1.log_dir, 'timing.setup.*.json'))
+    with open(timing_files[0], 'r') as f:
+        report = sjson.load(f)
+    for exp in report['experiments']:
+        assert exp['phases']['make_experiments'] >= 1.0
+
+
 def test_matrix_vector_workspace_full():
     test_config = """
 ramble:
@@ -583,6 +815,128 @@ spack:
         assert os.path.exists(os.path.join(exp_base, exp))
 
 
+def test_where_filtered_setup():
+    test_config = """
+ramble:
+  mpi:
+    command: mpirun
+    args:
+    - '-n'
+    - '{n_ranks}'
+    - '-ppn'
+    - '{processes_per_node}'
+    - '-hostfile'
+    - 'hostfile'
+  batch:
+    submit: 'batch_submit {execute_experiment}'
+  variables:
+    processes_per_node: [2, 4]
+    n_ranks: '{processes_per_node}*{n_nodes}'
+  applications:
+    basic:
+      workloads:
+        test_wl:
+          experiments:
+            exp_{n_nodes}_{processes_per_node}_{partition}:
+              variables:
+                n_nodes: [1, 2]
+                partition: ['part1', 'part2']
+              matrices:
+               - - n_nodes
+                 - partition
+spack:
+  concretized: true
+"""
+
+    workspace_name = 'test_where_filter'
+    ws1 = ramble.workspace.create(workspace_name)
+    ws1.write()
+
+    config_path = os.path.join(ws1.config_dir, ramble.workspace.config_file_name)
+
+    with open(config_path, 'w+') as f:
+        f.write(test_config)
+
+    ws1._re_read()
+
+    workspace_flags = ['-w', workspace_name]
+
+    workspace('setup', '--dry-run',
+              '--where', "n_ranks >= 4 and partition == 'part2'",
+              global_args=workspace_flags)
+
+    exp_base = os.path.join(ws1.experiment_dir, 'basic', 'test_wl')
+    assert sorted(os.listdir(exp_base)) == ['exp_1_4_part2',
+                                            'exp_2_2_part2',
+                                            'exp_2_4_part2']
+
+    output = workspace('setup', '--dry-run', '--where', 'n_nodes >=',
+                       global_args=workspace_flags, fail_on_error=False)
+    assert 'Invalid filter expression' in output
+
+    workspace('setup', '--dry-run', '--where', 'undefined_var > 1',
+              global_args=workspace_flags, fail_on_error=False)
+    assert isinstance(workspace.error, ramble.expander.ExperimentFilterError)
+
+
+def test_where_filter_on_derived_variables():
+    test_config = """
+ramble:
+  mpi:
+    command: mpirun
+    args:
+    - '-n'
+    - '{n_ranks}'
+  batch:
+    submit: '{execute_experiment}'
+  variables:
+    processes_per_node: 4
+  applications:
+    basic:
+      workloads:
+        test_wl:
+          experiments:
+            exp_{n_ranks}:
+              variables:
+                n_ranks: [2, 8, 16]
+spack:
+  concretized: true
+"""
+
+    workspace_name = 'test_where_derived'
+    ws1 = ramble.workspace.create(workspace_name)
+    ws1.write()
+
+    config_path = os.path.join(ws1.config_dir, ramble.workspace.config_file_name)
+
+    with open(config_path, 'w+') as f:
+        f.write(test_config)
+
+    ws1._re_read()
+
+    # n_nodes is derived from n_ranks and processes_per_node, separately for
+    # every experiment
+    workspace('setup', '--dry-run', '--where', 'n_nodes >= 2',
+              global_args=['-w', workspace_name])
+
+    exp_base = os.path.join(ws1.experiment_dir, 'basic', 'test_wl')
+    assert sorted(os.listdir(exp_base)) == ['exp_16', 'exp_8']
+
+    # Progress reporting counts the experiments the filter selects, even
+    # when it refers to variables set when experiments are finalized
+    assert ws1._count_experiments(
+        ramble.expander.ExperimentFilter('n_nodes >= 2')) == 2
+
+    where = "'exp_1' in experiment_run_dir and log_file != ''"
+    assert ws1._count_experiments(
+        ramble.expander.ExperimentFilter(where)) == 1
+
+    fs.remove_directory_contents(exp_base)
+    workspace('setup', '--dry-run', '--where', where,
+              global_args=['-w', workspace_name])
+    assert os.listdir(exp_base) == ['exp_16']
+
+
 def test_invalid_vector_workspace():
     test_config = """
 ramble:
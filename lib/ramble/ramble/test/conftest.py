@@ -38,9 +38,30 @@ def pytest_addoption(parser):
     group.addoption(
         '--fast', action='store_true', default=False,
         help='runs only "fast" unit tests, instead of the whole suite')
+    group.addoption(
+        '--benchmarks', action='store_true', default=False,
+        help='run benchmarks, which compare timings against a baseline ' +
+             'and are skipped by default')
+    group.addoption(
+        '--update-benchmark-baseline', action='store_true', default=False,
+        help='record benchmark results as the new baseline. Implies ' +
+             '--benchmarks')
+    group.addoption(
+        '--benchmark-threshold', type=float, default=2.0,
+        help='allowed fractional slowdown relative to the benchmark ' +
+             'baseline before a benchmark fails (default: 2.0)')
 
 
 def pytest_collection_modifyitems(config, items):
+    # Benchmark timings depend on the machine, so they only run on request
+    if not (config.getoption('--benchmarks') or
+            config.getoption('--update-benchmark-baseline')):
+        skip_benchmark = pytest.mark.skip(
+            reason='benchmark [--benchmarks command line option not given]')
+        for item in items:
+            if 'benchmark' in item.keywords:
+                item.add_marker(skip_benchmark)
+
     if not config.getoption('--fast'):
         # --fast not given, run all the tests
         return
@@ -7,10 +7,14 @@
 # except according to those terms.
 
 import os
+import csv
+import re
 import glob
 
 import pytest
 
+import spack.util.spack_json as sjson
+
 import ramble.workspace
 from ramble.main import RambleCommand
 
@@ -227,6 +231,22 @@ licenses:
             assert 'Avg. Max Ratio Time = 0.6' in data
             assert 'Number of timesteps = 5' in data
 
+            # Per-rank timestep samples are only used by the aggregates
+            assert not re.search(r'^\s*Timestep Time =', data, re.MULTILINE)
+
+        with open(json_results_files[0], 'r') as f:
+            serial_results = sjson.load(f)
+
+        # Parallel analysis should produce identical results
+        for results_file in json_results_files:
+            os.remove(results_file)
+        workspace('analyze', '--jobs', '4', '-f', 'json',
+                  global_args=['-w', workspace_name])
+        json_results_files = glob.glob(os.path.join(ws1.root, 'results*.json'))
+        assert len(json_results_files) == 1
+        with open(json_results_files[0], 'r') as f:
+            assert sjson.load(f) == serial_results
+
         output = workspace('archive', global_args=['-w', workspace_name])
 
         assert ws1.latest_archive
@@ -241,3 +261,158 @@ licenses:
             assert os.path.exists(os.path.join(exp_dir, 'rsl.out.0000'))
             for i in range(0, 5):
                 assert os.path.exists(os.path.join(exp_dir, f'rsl.error.000{i}'))
+
+
+def test_incremental_analysis(monkeypatch):
+    import ramble.application
+    test_config = """
+ramble:
+  mpi:
+    command: mpirun
+    args: []
+  batch:
+    submit: '{execute_experiment}'
+  variables:
+    processes_per_node: '1'
+    n_ranks: '1'
+    n_nodes: '1'
+  applications:
+    hostname:
+      workloads:
+        serial:
+          experiments:
+            test_{idx}:
+              variables:
+                idx: ['1', '2', '3']
+spack:
+  concretized: true
+"""
+
+    workspace_name = 'test_incremental_analysis'
+    with ramble.workspace.create(workspace_name) as ws1:
+        ws1.write()
+
+        config_path = os.path.join(ws1.config_dir, ramble.workspace.config_file_name)
+        with open(config_path, 'w+') as f:
+            f.write(test_config)
+        ws1._re_read()
+
+        workspace('setup', '--dry-run', global_args=['-w', workspace_name])
+
+        exp_base = os.path.join(ws1.experiment_dir, 'hostname', 'serial')
+        for idx in range(1, 4):
+            with open(os.path.join(exp_base, f'test_{idx}',
+                                   f'test_{idx}.out'), 'w+') as f:
+                f.write(f'{idx}.5user 0.00system\n')
+
+        analyzed = []
+        analyze_logs = ramble.application.analyze_experiment_logs
+
+        def counting_analyze(exp_ns, *args):
+            analyzed.append(exp_ns)
+            return analyze_logs(exp_ns, *args)
+
+        monkeypatch.setattr(ramble.application, 'analyze_experiment_logs',
+                            counting_analyze)
+
+        def analyze():
+            del analyzed[:]
+            for results_file in glob.glob(os.path.join(ws1.root, 'results*.json')):
+                os.remove(results_file)
+            workspace('analyze', '-f', 'json', global_args=['-w', workspace_name])
+            results_file = glob.glob(os.path.join(ws1.root, 'results*.json'))[0]
+            with open(results_file, 'r') as f:
+                return sjson.load(f)
+
+        first = analyze()
+        assert len(analyzed) == 3
+        assert os.path.exists(ws1.analysis_cache_path)
+
+        # Nothing changed, everything comes from the cache
+        assert analyze() == first
+        assert not analyzed
+
+        # Only the modified experiment is scanned again
+        with open(os.path.join(exp_base, 'test_2', 'test_2.out'), 'w+') as f:
+            f.write('42.25user 0.00system\n')
+        results = analyze()
+        assert analyzed == ['hostname.serial.test_2']
+        fom = results['hostname.serial.test_2']['CONTEXTS']['null']['user time']
+        assert fom['value'] == '42.25'
+        assert results['hostname.serial.test_1'] == first['hostname.serial.test_1']
+
+        def cached_experiments():
+            with open(ws1.analysis_cache_path, 'r') as f:
+                return set(sjson.load(f)['experiments'])
+
+        all_experiments = set('hostname.serial.test_%s' % idx for idx in range(1, 4))
+        assert cached_experiments() == all_experiments
+
+        # Experiments outside of a filter keep their cached analysis
+        workspace('analyze', '-f', 'json', '--where', "idx == '1'",
+                  global_args=['-w', workspace_name])
+        assert cached_experiments() == all_experiments
+
+        # Experiments removed from the config are pruned from the cache
+        with open(config_path, 'w+') as f:
+            f.write(test_config.replace("['1', '2', '3']", "['1', '2']"))
+        ws1._re_read()
+        analyze()
+        assert cached_experiments() == all_experiments - set(['hostname.serial.test_3'])
+
+
+def test_referenced_results_variables_in_tables():
+    import ramble.config
+    test_config = """
+ramble:
+  mpi:
+    command: mpirun
+    args: []
+  batch:
+    submit: '{execute_experiment}'
+  variables:
+    processes_per_node: '2'
+    n_nodes: '1'
+  applications:
+    hostname:
+      workloads:
+        serial:
+          experiments:
+            test:
+              variables: {}
+spack:
+  concretized: true
+"""
+
+    workspace_name = 'test_referenced_results_variables'
+    with ramble.workspace.create(workspace_name) as ws1:
+        ws1.write()
+
+        config_path = os.path.join(ws1.config_dir, ramble.workspace.config_file_name)
+        with open(config_path, 'w+') as f:
+            f.write(test_config)
+        ws1._re_read()
+
+        workspace('setup', '--dry-run', global_args=['-w', workspace_name])
+
+        exp_dir = os.path.join(ws1.experiment_dir, 'hostname', 'serial', 'test')
+        with open(os.path.join(exp_dir, 'test.out'), 'w+') as f:
+            f.write('1.5user 0.00system\n')
+
+        with ramble.config.override('config:results_variables', 'referenced'):
+            ws1.run_pipeline('analyze')
+        fn = ws1.dump_results(output_formats=['csv'])
+
+        with open(os.path.join(ws1.root, fn + '.csv'), 'r') as f:
+            rows = list(csv.DictReader(f))
+
+        # Variables of the table columns are recorded, though no template
+        # refers to them
+        assert rows
+        for row in rows:
+            assert row['application_name'] == 'hostname'
+            assert row['experiment_name'] == 'test'
+            assert row['n_nodes'] == '1'
+            assert row['n_ranks'] == '2'
+            assert row['processes_per_node'] == '2'
+            assert row['n_threads'] == '1'
@@ -311,3 +311,306 @@ def test_matrix_vector_expansions(mutable_mock_workspace_path):
             expected_exp_names.remove(exp.experiment_name)
 
     assert len(expected_exp_names) == 0
+
+
+@pytest.mark.parametrize('template', [
+    'plain string',
+    '{level1_var}',
+    '{{escaped}} {level1_var}',
+    '{undefined_var}/{level1_var}',
+    '{level1_var:>10}',
+    '{level1_var!r}',
+    "awk '{print $1}'",
+])
+def test_compiled_template_matches_format_map(template):
+    values = ramble.expander.ExpansionDict({'level1_var': 'level1'})
+
+    compiled = ramble.expander.compile_template(template)
+    assert compiled.render(values) == template.format_map(values)
+    assert ramble.expander.compile_template(template) is compiled
+
+
+def test_compiled_template_keywords():
+    compiled = ramble.expander.compile_template('{a}/{b}/{a} {{c}}')
+    assert compiled.keywords == ('a', 'b')
+    assert not compiled.fully_expanded()
+
+    assert ramble.expander.compile_template('{{c}}').fully_expanded()
+
+    invalid = ramble.expander.compile_template('{a} }')
+    assert invalid.keywords == ('a', )
+    with pytest.raises(ValueError):
+        invalid.render({})
+
+
+def test_expansion_memo_invalidation(mutable_mock_workspace_path):
+    workspace('create', 'test')
+
+    with ramble.workspace.read('test') as ws:
+        exp = ramble.expander.Expander(ws)
+
+        exp.set_var('var_a', '1')
+        exp.set_var('var_b', '{var_a}+1')
+        assert exp.expand_var('{var_b}') == '2'
+
+        generation = exp._scope_generation
+        exp.set_var('var_a', '2')
+        assert exp._scope_generation > generation
+        assert exp.expand_var('{var_b}') == '3'
+
+        exp.remove_var('var_a')
+        assert exp.expand_var('{var_b}') == '{var_a}+1'
+
+        exp.set_application('basic')
+        exp.set_application_vars({'var_a': '10'})
+        assert exp.expand_var('{var_b}') == '11'
+
+
+def test_dependency_order():
+    expansion_vars = {
+        'n_ranks': '{processes_per_node}*{n_nodes}',
+        'processes_per_node': '4',
+        'n_nodes': '{base_nodes}',
+        'base_nodes': 2,
+        'command': 'mpirun -n {n_ranks} {undefined_var}'
+    }
+
+    order = ramble.expander.dependency_order(expansion_vars, ['command'])
+    assert order[-1] == 'command'
+    assert order.index('base_nodes') < order.index('n_nodes')
+    assert order.index('n_nodes') < order.index('n_ranks')
+    assert order.index('processes_per_node') < order.index('n_ranks')
+    assert 'undefined_var' not in order
+
+
+def test_variable_cycle_detection(mutable_mock_workspace_path):
+    workspace('create', 'test')
+
+    with ramble.workspace.read('test') as ws:
+        exp = ramble.expander.Expander(ws)
+
+        exp.set_var('var_a', '{var_b}')
+        exp.set_var('var_b', '{var_c}')
+        exp.set_var('var_c', '{var_a}')
+        exp.set_var('unrelated', 'value')
+
+        assert exp.expand_var('{unrelated}') == 'value'
+
+        with pytest.raises(ramble.expander.VariableCycleError) as err:
+            exp.expand_var('{var_a}')
+
+        assert 'var_a -> var_b -> var_c -> var_a' in str(err.value)
+
+        with pytest.raises(ramble.expander.VariableCycleError):
+            exp.all_vars()
+
+
+@pytest.mark.parametrize('expr,expected', [
+    ('7//2', '3'),
+    ('7%4', '3'),
+    ('ceil(7/2)', '4'),
+    ('floor(7/2)', '3'),
+    ('min(4, 2, 8)', '2'),
+    ('max(4, 2, 8)', '8'),
+    ('3 > 2', '3 > 2'),
+    ('1 < 2 <= 2', '1 < 2 <= 2'),
+    ('3 == 3', '3 == 3'),
+    ('ceil({n_ranks}/{ppn})', '3'),
+    ('mpirun', 'mpirun'),
+    ('/path/to/1', '/path/to/1'),
+    ('print(1)', 'print(1)'),
+    ('1 << 2', '1 << 2'),
+])
+def test_extended_math(mutable_mock_workspace_path, expr, expected):
+    workspace('create', 'test')
+
+    with ramble.workspace.read('test') as ws:
+        exp = ramble.expander.Expander(ws)
+        exp.set_var('n_ranks', '10')
+        exp.set_var('ppn', '4')
+
+        assert exp.expand_var(expr) == expected
+
+
+def test_math_candidates():
+    assert ramble.expander.is_math_candidate('2*(3+4)')
+    assert ramble.expander.is_math_candidate('1e5/2')
+    assert ramble.expander.is_math_candidate('ceil(5/2)')
+    assert not ramble.expander.is_math_candidate('mpirun -n 4')
+    assert not ramble.expander.is_math_candidate('/usr/bin/')
+    assert not ramble.expander.is_math_candidate('abs(-1)')
+    assert not ramble.expander.is_math_candidate('')
+
+    assert ramble.expander.evaluate_math('mpirun') is \
+        ramble.expander.not_math
+
+
+def test_layered_scopes_copy_on_write(mutable_mock_workspace_path):
+    workspace('create', 'test')
+
+    experiment_vars = {'exp_var': 'test_exp'}
+
+    with ramble.workspace.read('test') as ws:
+        exp = ramble.expander.Expander(ws)
+        exp.set_application('basic')
+        exp.set_application_vars({'app_var': 'test_app'})
+        exp.set_workload('test_wl')
+        exp.set_workload_vars({'exp_var': 'from_wl'})
+        exp.set_experiment('single_node')
+        exp.set_experiment_vars(experiment_vars)
+
+        assert exp.expand_var('{exp_var}') == 'test_exp'
+
+        exp.set_var('exp_var', 'modified', level='experiment')
+        assert exp.expand_var('{exp_var}') == 'modified'
+        assert experiment_vars == {'exp_var': 'test_exp'}
+
+        child = exp.get_expansion_dict({'app_var': 'extra'})
+        assert child['app_var'] == 'extra'
+        child['new_var'] = 'child_only'
+        assert 'new_var' not in exp.get_expansion_dict()
+        assert exp.expand_var('{app_var}') == 'test_app'
+        assert exp.expand_var('{app_var}', extra_vars={'app_var': 'x'}) == 'x'
+
+
+def test_experiment_space_order_and_count():
+    import itertools
+    vector_names = ['exp_idx']
+    vectors = [[1, 2, 3]]
+    matrices = [(['n_nodes', 'ppn'], [[1, 2], [10, 20, 30]]),
+                (['mode'], [['a', 'b', 'c', 'd', 'e', 'f']])]
+
+    space = ramble.expander.ExperimentSpace(vector_names, vectors, matrices)
+    assert len(space) == 18
+
+    expected = []
+    for idx in vectors[0]:
+        zipped = zip(itertools.product(*matrices[0][1]),
+                     itertools.product(*matrices[1][1]))
+        for (n_nodes, ppn), (mode,) in zipped:
+            expected.append({'exp_idx': idx, 'n_nodes': n_nodes,
+                             'ppn': ppn, 'mode': mode})
+
+    assert list(space) == expected
+    assert space[7] == expected[7]
+
+    with pytest.raises(IndexError):
+        space[18]
+
+    assert len(ramble.expander.ExperimentSpace([], [], [])) == 1
+    assert list(ramble.expander.ExperimentSpace([], [], [])) == [{}]
+
+
+def test_experiment_space_count_before_render(mutable_mock_workspace_path):
+    workspace('create', 'test')
+
+    with ramble.workspace.read('test') as ws:
+        exp = ramble.expander.Expander(ws)
+        exp.set_application('basic')
+        exp.set_application_vars({})
+        exp.set_workload('test_wl')
+        exp.set_workload_vars({})
+        exp.set_experiment('exp_{n_nodes}_{processes_per_node}')
+        exp.set_experiment_vars({'n_nodes': [1, 2, 4],
+                                 'processes_per_node': [10, 20]})
+        exp.set_experiment_matrices([['n_nodes', 'processes_per_node']])
+
+        assert len(exp.experiment_space()) == 6
+
+        names = [exp.experiment_name for _ in exp.rendered_experiments()]
+        assert names == ['exp_1_10', 'exp_1_20', 'exp_2_10',
+                         'exp_2_20', 'exp_4_10', 'exp_4_20']
+
+
+@pytest.mark.parametrize('expression,expected', [
+    ('n_nodes >= 2', True),
+    ('n_nodes > 2', False),
+    ("partition == 'part2'", True),
+    ("partition in ['part1', 'part3']", False),
+    ('1 < n_nodes * ppn <= 20 and not n_nodes == 1', True),
+    ("n_nodes == 1 or partition != 'part1'", True),
+])
+def test_experiment_filter(mutable_mock_workspace_path, expression, expected):
+    workspace('create', 'test')
+
+    with ramble.workspace.read('test') as ws:
+        exp = ramble.expander.Expander(ws)
+        exp.set_application('basic')
+        exp.set_application_vars({'n_nodes': '2', 'ppn': '{n_nodes}*5'})
+        exp.set_workload('test_wl')
+        exp.set_workload_vars({'partition': 'part2'})
+
+        experiment_filter = ramble.expander.ExperimentFilter(expression)
+        assert experiment_filter.matches(exp) == expected
+
+
+def test_experiment_filter_errors(mutable_mock_workspace_path):
+    with pytest.raises(ramble.expander.ExperimentFilterError):
+        ramble.expander.ExperimentFilter('n_nodes >')
+
+    with pytest.raises(ramble.expander.ExperimentFilterError):
+        ramble.expander.ExperimentFilter('__import__("os")')
+
+
+def test_expand_many(mutable_mock_workspace_path):
+    workspace('create', 'test')
+
+    with ramble.workspace.read('test') as ws:
+        exp = ramble.expander.Expander(ws)
+        exp.set_application('basic')
+        exp.set_application_vars({'app_var': 'test_app', 'n': '2*3'})
+        exp.set_workload('test_wl')
+        exp.set_workload_vars({})
+        exp.set_experiment('single_node')
+        exp.set_experiment_vars({})
+
+        templates = ['{app_var}/{n}', '{n}', 'plain', '{app_var}/{n}',
+                     '{undefined}']
+        assert exp.expand_many(templates) == \
+            [exp.expand_var(t) for t in templates]
+
+        extra_vars = {'app_var': 'extra'}
+        assert exp.expand_many(templates, extra_vars) == \
+            [exp.expand_var(t, extra_vars) for t in templates]
+        assert exp.expand_many(['{app_var}']) == ['test_app']
+
+
+def test_referenced_vars(mutable_mock_workspace_path, mutable_mock_repo):
+    import ramble.config
+    workspace('create', 'test')
+
+    with ramble.workspace.read('test') as ws:
+        exp = ramble.expander.Expander(ws)
+        exp.set_application('basic')
+        exp.set_application_vars({'app_var': '{wl_var}', 'unused': 'x'})
+        exp.set_workload('test_wl')
+        exp.set_workload_vars({'wl_var': '{n_nodes}', 'n_nodes': '2'})
+        exp.set_experiment('exp_{app_var}')
+        exp.set_experiment_vars({'exp_var': 'y'})
+
+        referenced = exp.referenced_vars(['{app_var}/out', 'plain'])
+        assert referenced == set(['app_var', 'wl_var', 'n_nodes'])
+
+        all_vars = exp.all_vars()
+        subset = exp.all_vars(names=referenced | set(['undefined']))
+        assert subset == dict((k, all_vars[k]) for k in referenced)
+
+        for _ in exp.rendered_experiments():
+            app_inst = mutable_mock_repo.get('basic')
+            assert app_inst._results_variables(ws, exp) == exp.all_vars()
+
+            with ramble.config.override('config:results_variables',
+                                        'referenced'):
+                recorded = app_inst._results_variables(ws, exp)
+            assert 'unused' not in recorded
+            for var in ['app_var', 'wl_var', 'n_nodes', 'experiment_name',
+                        'workload_name', 'application_name']:
+                assert recorded[var] == all_vars.get(var, recorded[var])
+            assert recorded['experiment_name'] == 'exp_2'
+
+            with ramble.config.override('config:results_include_variables',
+                                        ['unused']):
+                with ramble.config.override('config:results_variables',
+                                            'referenced'):
+                    recorded = app_inst._results_variables(ws, exp)
+            assert recorded['unused'] == 'x'
@@ -0,0 +1,229 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+"""Micro-benchmarks for the expander
+
+Each scenario builds a synthetic workspace with a configurable number of
+variables, nesting depth, and vector / matrix sizes. The latency and peak
+memory of the core expander operations are compared against the baseline
+in test/data/benchmarks/expander.json.
+
+Timings depend on the machine the baseline was recorded on, so the
+benchmarks are skipped unless requested with:
+
+    ramble unit-test --benchmarks test/expander_benchmark.py
+
+The baseline can be regenerated with:
+
+    ramble unit-test --update-benchmark-baseline test/expander_benchmark.py
+"""
+
+import os
+import time
+import tracemalloc
+
+import pytest
+
+import spack.util.spack_json as sjson
+
+import ramble.paths
+import ramble.workspace
+import ramble.expander
+from ramble.main import RambleCommand
+
+pytestmark = [pytest.mark.benchmark,
+              pytest.mark.maybeslow,
+              pytest.mark.usefixtures('mutable_mock_workspace_path',
+                                      'config', 'mutable_mock_repo')]
+
+workspace = RambleCommand('workspace')
+
+baseline_path = os.path.join(ramble.paths.test_path, 'data', 'benchmarks',
+                             'expander.json')
+
+#: Memory is far less noisy than time, so it uses a tighter threshold.
+#: Growth below memory_slack bytes is never treated as a regression.
+memory_threshold = 0.5
+memory_slack = 4096
+
+#: Number of timing repetitions. The fastest repetition is reported.
+repeats = 7
+
+scenarios = {
+    'flat': {'n_vars': 500, 'depth': 1, 'vector_length': 0, 'matrix_dims': 0},
+    'nested': {'n_vars': 500, 'depth': 10, 'vector_length': 0,
+               'matrix_dims': 0},
+    'vector': {'n_vars': 50, 'depth': 3, 'vector_length': 500,
+               'matrix_dims': 0},
+    'matrix': {'n_vars': 50, 'depth': 3, 'vector_length': 10,
+               'matrix_dims': 3},
+}
+
+
+def synthetic_variables(n_vars, depth, vector_length, matrix_dims):
+    """Generate the variables and matrices of a synthetic experiment
+
+    Variables are built as chains of `depth` variables, each adding to the
+    previous one, so every chain ends in a math expression.
+
+    Returns:
+        app_vars (dict): Application level variables
+        exp_vars (dict): Experiment level variables
+        matrices (list): Experiment matrices
+        exp_template (str): Experiment name template
+    """
+    app_vars = {}
+    n_chains = max(1, n_vars // depth)
+    for chain in range(n_chains):
+        app_vars['var_%s_0' % chain] = str(chain)
+        for level in range(1, depth):
+            app_vars['var_%s_%s' % (chain, level)] = \
+                '{var_%s_%s}+%s' % (chain, level - 1, level)
+
+    exp_vars = {'n_nodes': '2', 'processes_per_node': '4'}
+    matrices = []
+    name_parts = []
+    if vector_length:
+        if matrix_dims:
+            matrix = []
+            for dim in range(matrix_dims):
+                vec_name = 'mat_%s' % dim
+                exp_vars[vec_name] = list(range(vector_length))
+                matrix.append(vec_name)
+                name_parts.append('{%s}' % vec_name)
+            matrices.append(matrix)
+        else:
+            exp_vars['vec_0'] = list(range(vector_length))
+            name_parts.append('{vec_0}')
+
+    exp_template = '_'.join(['exp'] + name_parts)
+    return app_vars, exp_vars, matrices, exp_template
+
+
+def leaf_templates(n_vars, depth):
+    n_chains = max(1, n_vars // depth)
+    return ['{var_%s_%s}/out' % (chain, depth - 1)
+            for chain in range(n_chains)]
+
+
+def measure(func, n_ops):
+    """Return (latency per op, peak memory in bytes) of calling func"""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best / max(n_ops, 1), peak
+
+
+def run_scenario(ws, n_vars, depth, vector_length, matrix_dims):
+    app_vars, exp_vars, matrices, exp_template = \
+        synthetic_variables(n_vars, depth, vector_length, matrix_dims)
+    templates = leaf_templates(n_vars, depth)
+
+    exp = ramble.expander.Expander(ws)
+    exp.set_application('basic')
+    exp.set_application_vars(app_vars)
+    exp.set_workload('test_wl')
+    exp.set_workload_vars({'wl_var': 'wl'})
+
+    def set_experiment():
+        exp.set_experiment(exp_template)
+        exp.set_experiment_vars(exp_vars)
+        exp.set_experiment_matrices(matrices)
+
+    set_experiment()
+
+    def invalidate():
+        exp.set_var('bench_invalidate', time.perf_counter(), 'experiment')
+
+    def get_expansion_dict():
+        for _ in range(100):
+            invalidate()
+            exp.get_expansion_dict()
+
+    def expand_var():
+        invalidate()
+        for template in templates:
+            exp.expand_var(template)
+
+    def all_vars():
+        invalidate()
+        exp.all_vars()
+
+    n_experiments = len(exp.experiment_space())
+
+    def rendered_experiments():
+        # Rendering overwrites the experiment scope, as in the workspace
+        set_experiment()
+        for _ in exp.rendered_experiments():
+            pass
+
+    results = {}
+    results['get_expansion_dict'] = measure(get_expansion_dict, 100)
+    results['expand_var'] = measure(expand_var, len(templates))
+    results['all_vars'] = measure(all_vars, 1)
+    results['rendered_experiments'] = measure(rendered_experiments,
+                                              n_experiments)
+    return results
+
+
+def read_baseline():
+    if not os.path.exists(baseline_path):
+        return {}
+    with open(baseline_path, 'r') as f:
+        return sjson.load(f)
+
+
+@pytest.mark.parametrize('scenario', sorted(scenarios.keys()))
+def test_expander_benchmark(request, scenario):
+    threshold = request.config.getoption('--benchmark-threshold')
+    update = request.config.getoption('--update-benchmark-baseline')
+
+    workspace('create', 'test')
+    with ramble.workspace.read('test') as ws:
+        results = run_scenario(ws, **scenarios[scenario])
+
+    print('\nExpander benchmark: %s %s' % (scenario, scenarios[scenario]))
+    for op, (latency, peak) in sorted(results.items()):
+        print('  %-22s %12.2f us/op %12.1f KiB peak' %
+              (op, latency * 1e6, peak / 1024.))
+
+    baseline = read_baseline()
+    if update:
+        baseline[scenario] = dict((op, {'latency': latency, 'peak_memory': peak})
+                                  for op, (latency, peak) in results.items())
+        with open(baseline_path, 'w') as f:
+            sjson.dump(baseline, f)
+        return
+
+    if scenario not in baseline:
+        pytest.skip('No baseline recorded for scenario %s' % scenario)
+
+    regressions = []
+    for op, (latency, peak) in sorted(results.items()):
+        if op not in baseline[scenario]:
+            continue
+        base = baseline[scenario][op]
+        if latency > base['latency'] * (1 + threshold):
+            regressions.append('%s latency %.2f us/op (baseline %.2f us/op)' %
+                               (op, latency * 1e6, base['latency'] * 1e6))
+        if peak > max(base['peak_memory'] * (1 + memory_threshold),
+                      base['peak_memory'] + memory_slack):
+            regressions.append('%s peak memory %s bytes (baseline %s bytes)' %
+                               (op, peak, base['peak_memory']))
+
+    assert not regressions, \
+        'Expander performance regressed in scenario %s:\n  %s' % \
+        (scenario, '\n  '.join(regressions))
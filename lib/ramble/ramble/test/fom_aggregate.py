@@ -0,0 +1,96 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+
+import re
+
+import pytest
+
+import ramble.application
+import ramble.fom_aggregate
+from ramble.language.application_language import DirectiveError
+from ramble.appkit import *  # noqa
+
+
+@pytest.mark.parametrize('statistic,expected', [
+    ('min', 1),
+    ('max', 10),
+    ('sum', 55),
+    ('mean', 5.5),
+    ('stddev', 8.25 ** 0.5),
+    ('count', 10),
+    ('balance', 0.55),
+    ('p0', 1.0),
+    ('p50', 5.5),
+    ('p90', 9.1),
+    ('p100', 10.0),
+])
+def test_aggregate(statistic, expected):
+    samples = ramble.fom_aggregate.new_samples()
+    samples.extend(range(10, 0, -1))
+
+    value = ramble.fom_aggregate.aggregate(statistic, samples, 'int')
+    assert value == pytest.approx(expected)
+    assert type(value) is type(expected)
+
+
+def test_aggregate_directive_validation():
+    assert ramble.fom_aggregate.is_statistic('p99.9')
+    assert not ramble.fom_aggregate.is_statistic('p101')
+
+    with pytest.raises(DirectiveError):
+        figure_of_merit_aggregate('bad', 'fom', 'median')  # noqa: F405
+
+    with pytest.raises(DirectiveError):
+        figure_of_merit('bad', '{log_file}', '(?P<v>.*)', 'v',  # noqa: F405
+                        fom_type='complex')
+
+
+def test_typed_and_aggregated_foms(tmpdir):
+    log = tmpdir.join('rank.out')
+    log.write('step 1.5\nstep 2.5\nsteps 2\nstep x\nstep 5.0\n')
+
+    foms = {
+        'Last step': {'regex': re.compile(r'step (?P<t>\S+)'),
+                      'contexts': [], 'group': 't', 'units': 's',
+                      'type': None, 'aggregate_only': False},
+        'Steps': {'regex': re.compile(r'steps (?P<n>\S+)'),
+                  'contexts': [], 'group': 'n', 'units': '',
+                  'type': 'int', 'aggregate_only': False},
+        'Step sample': {'regex': re.compile(r'step (?P<t>\S+)'),
+                        'contexts': [], 'group': 't', 'units': 's',
+                        'type': 'float', 'aggregate_only': True}
+    }
+    files = {str(log): {'contexts': [],
+                        'foms': ['Last step', 'Steps', 'Step sample'],
+                        'tail_kb': None}}
+    aggregates = {
+        'Mean step': {'fom': 'Last step', 'statistic': 'mean',
+                      'units': None},
+        'Step count': {'fom': 'Last step', 'statistic': 'count',
+                       'units': None},
+        'Slowest step': {'fom': 'Last step', 'statistic': 'max',
+                         'units': 'seconds'},
+        'Total step': {'fom': 'Step sample', 'statistic': 'sum',
+                       'units': None},
+    }
+
+    results = ramble.application.analyze_experiment_logs(
+        'exp', {}, files, {}, foms, aggregates)
+    values = results['exp']['CONTEXTS']['null']
+
+    # Untyped values are kept as strings, and are only aggregated when
+    # they are numeric
+    assert values['Last step'] == {'value': '5.0', 'units': 's'}
+    assert values['Steps'] == {'value': 2, 'units': ''}
+    assert values['Mean step'] == {'value': 3.0, 'units': 's'}
+    assert values['Step count'] == {'value': 3, 'units': ''}
+    assert values['Slowest step'] == {'value': 5.0, 'units': 'seconds'}
+
+    # Values of aggregate only foms are not reported themselves
+    assert 'Step sample' not in values
+    assert values['Total step'] == {'value': 9.0, 'units': 's'}
@@ -0,0 +1,115 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+
+import re
+
+import pytest
+
+import ramble.repository
+import ramble.fom_scanner
+
+pytestmark = pytest.mark.usefixtures('config')
+
+sample_lines = [
+    'Timing for main: time 2019-11-27_00:00:12 on domain   1:    3.30000 '
+    'elapsed seconds\n',
+    '# Benchmarking PingPong\n',
+    '            0         1000         0.19         0.00\n',
+    '         1024         1000         0.37      2764.79\n',
+    'WR11C2R4       40000   192     4     4             180.22'
+    '              2.3676e+02\n',
+    'Final Summary::HPCG result is VALID with a GFLOP/s rating of=8.59\n',
+    'Final Summary::HPCG 2.4 rating for historical reasons is=8.7\n',
+    'Performance: 1234.5 tau/day, 2.857 timesteps/s\n',
+    'Elapsed time         =      12.34 (s)\n',
+    'Grind time (us/z/c)  = 0.61234 (per dom)  ( 12.3 overall)\n',
+    '0.52user 0.01system 0:00.53elapsed 100%CPU\n',
+    '  ExecutionTime = 41.5 s  ClockTime = 42 s\n',
+    'Triad:          40351.6     0.012     0.012     0.012\n',
+    '\n',
+    'nothing of interest here\n',
+]
+
+
+def check_scanner(patterns, lines):
+    scanner = ramble.fom_scanner.LineScanner(patterns)
+    for line in lines:
+        expected = [(i, match.group(0)) for i, match in
+                    [(i, re.match(pattern, line))
+                     for i, pattern in enumerate(patterns)] if match]
+        found = [(i, match.group(0)) for i, match in scanner.matches(line)]
+        assert found == expected
+
+
+def test_scanner_matches_builtin_regexes():
+    patterns = []
+    for app_name in ramble.repository.all_application_names():
+        app_inst = ramble.repository.get(app_name)
+        patterns.extend(conf['regex'] for conf in
+                        app_inst.figure_of_merit_contexts.values())
+        patterns.extend(conf['regex'] for conf in
+                        app_inst.figures_of_merit.values())
+
+    assert len(patterns) > 50
+    check_scanner(patterns, sample_lines)
+
+
+def test_scanner_unmergeable_patterns():
+    patterns = [r'(?i)abc(?P<x>\d)', r'(a)\1', r'(?P<x>\d+)x(?P=x)',
+                r'[(?P<q>]z', r'\\(?P<w>b)', r'foo(?:bar|baz)(?P<v>\d+)',
+                r'(?P<v>\d+)user']
+    lines = ['ABC5', 'aa', '12x12', '<z', '(z', '\\b', 'foobaz12', '12user',
+             'none']
+
+    scanner = ramble.fom_scanner.LineScanner(patterns)
+    assert len(scanner._unmerged) == 5
+
+    check_scanner(patterns, lines)
+
+
+def scan_lines(path, patterns, tail=None):
+    scanner = ramble.fom_scanner.LineScanner(patterns)
+    return [(i, match.group(0)) for i, match in
+            scanner.scan_file(path, tail=tail)]
+
+
+@pytest.mark.parametrize('threshold', [0, 2**62])
+def test_scan_file_matches_lines(tmpdir, monkeypatch, threshold):
+    monkeypatch.setattr(ramble.fom_scanner, 'mmap_threshold', threshold)
+    patterns = [r'(?P<a>\d+)\s+user', r'Triad:\s+(?P<t>[0-9.]+)',
+                r'.*(?P<e>\S+) (s)$']
+    lines = sample_lines + ['12\x1cuser\n', 'Triad: 1.5 é\n', '3 user']
+    log = tmpdir.join('log')
+    log.write_text(''.join(lines), encoding='utf-8')
+
+    expected = [(i, match.group(0)) for line in lines
+                for i, match in ramble.fom_scanner.LineScanner(
+                    patterns).matches(line)]
+    assert len(expected) == 5
+    assert ramble.fom_scanner.LineScanner(patterns)._file_literals
+    assert scan_lines(str(log), patterns) == expected
+
+    # Text mode translates carriage returns
+    log.write_binary(''.join(lines).replace('\n', '\r\n').encode('utf-8'))
+    assert scan_lines(str(log), patterns) == expected
+
+
+@pytest.mark.parametrize('threshold', [0, 2**62])
+def test_scan_file_tail(tmpdir, monkeypatch, threshold):
+    monkeypatch.setattr(ramble.fom_scanner, 'mmap_threshold', threshold)
+    log = tmpdir.join('log')
+    log.write('value 1\nvalue 22\nvalue 333\n')
+    patterns = [r'value (?P<v>\d+)', r'(?P<x>x)']
+
+    assert scan_lines(str(log), patterns, tail=10) == [(0, 'value 333')]
+    # A window starting on the first character of a line includes it
+    assert scan_lines(str(log), patterns, tail=19) == [(0, 'value 22'),
+                                                       (0, 'value 333')]
+    assert scan_lines(str(log), patterns, tail=100) == [(0, 'value 1'),
+                                                        (0, 'value 22'),
+                                                        (0, 'value 333')]
@@ -0,0 +1,201 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+
+import csv
+import math
+
+import six
+import pytest
+
+import spack.util.spack_json as sjson
+import spack.util.spack_yaml as syaml
+
+import ramble.results
+
+
+def sample_results(n_experiments):
+    results = {}
+    for i in range(n_experiments):
+        exp = 'app.wl.exp_%s' % i
+        if i % 2:
+            results[exp] = {'RAMBLE_STATUS': 'FAILED'}
+        else:
+            results[exp] = {
+                'RAMBLE_STATUS': 'SUCCESS',
+                'RAMBLE_VARIABLES': {'n_ranks': str(i), 'multi': 'a: b\nc'},
+                'CONTEXTS': {'null': {'time': {'value': '%s.5' % i,
+                                               'units': 's'}}}
+            }
+    return results
+
+
+@pytest.mark.parametrize('n_experiments', [0, 1, 5])
+def test_stream_matches_dump(tmpdir, n_experiments):
+    results = sample_results(n_experiments)
+
+    stream = ramble.results.ResultsStream(str(tmpdir.join('stream.jsonl')))
+    for exp, exp_results in results.items():
+        stream.append({exp: exp_results})
+    stream.close()
+
+    assert list(stream.records()) == list(results.items())
+
+    streamed = {}
+    for name in ['json', 'yaml', 'jsonl']:
+        out = six.StringIO()
+        ramble.results.output_formats[name].writer(stream.records(), out)
+        streamed[name] = out.getvalue()
+
+    assert streamed['json'] == sjson.dump(results)
+    assert streamed['yaml'] == syaml.dump(results)
+    assert streamed['jsonl'] == open(stream.path).read()
+
+
+@pytest.mark.parametrize('n_experiments', [0, 5])
+def test_tabular_formats(tmpdir, monkeypatch, n_experiments):
+    # Exercise multiple row groups
+    monkeypatch.setattr(ramble.results, 'columns_row_group_size', 2)
+
+    results = sample_results(n_experiments)
+    variables = ['n_ranks', 'missing']
+    columns = ramble.results.table_columns + variables
+
+    rows = list(ramble.results.result_rows(results.items(), variables))
+    assert len(rows) == n_experiments
+    if n_experiments:
+        assert rows[0] == ['app.wl.exp_0', 'SUCCESS', 'null', 'time', 0.5,
+                           '0.5', 's', 0, None]
+        assert rows[1][:4] == ['app.wl.exp_1', 'FAILED', None, None]
+
+    csv_path = str(tmpdir.join('results.csv'))
+    with open(csv_path, 'w') as f:
+        ramble.results.write_csv(results.items(), f, variables=variables)
+    with open(csv_path, 'r') as f:
+        csv_rows = list(csv.reader(f))
+    assert csv_rows[0] == columns
+    assert len(csv_rows) == n_experiments + 1
+
+    columns_path = str(tmpdir.join('results.columns'))
+    with open(columns_path, 'wb') as f:
+        ramble.results.write_columns(results.items(), f, variables=variables)
+    table = ramble.results.read_columns(columns_path)
+    assert list(table.keys()) == columns
+    for i, name in enumerate(columns):
+        expected = [row[i] for row in rows]
+        if name in ['value', 'n_ranks', 'missing']:
+            assert [None if math.isnan(v) else v for v in table[name]] == \
+                expected
+        else:
+            assert table[name] == expected
+
+
+def test_tabular_float_values(tmpdir):
+    results = {
+        'app.wl.exp': {
+            'RAMBLE_STATUS': 'SUCCESS',
+            'RAMBLE_VARIABLES': {'n_ranks': '4', 'ratio': '0.5'},
+            'CONTEXTS': {'null': {
+                'float': {'value': 1.825, 'units': 's'},
+                'string': {'value': '1.825', 'units': 's'},
+                'int': {'value': 3, 'units': ''},
+                'bool': {'value': True, 'units': ''},
+            }}
+        }
+    }
+    variables = ['n_ranks', 'ratio']
+
+    assert ramble.results.typed_value('-12') == -12
+    assert ramble.results.typed_value('1e3') == 1000.0
+    assert ramble.results.typed_value('a1') is None
+    assert ramble.results.typed_value(None) is None
+
+    csv_path = str(tmpdir.join('results.csv'))
+    with open(csv_path, 'w') as f:
+        ramble.results.write_csv(results.items(), f, variables=variables)
+    with open(csv_path, 'r') as f:
+        csv_rows = list(csv.DictReader(f))
+    assert [(row['fom'], row['value'], row['value_text'], row['n_ranks'],
+             row['ratio']) for row in csv_rows] == [
+        ('float', '1.825', '1.825', '4', '0.5'),
+        ('string', '1.825', '1.825', '4', '0.5'),
+        ('int', '3', '3', '4', '0.5'),
+        ('bool', '', 'True', '4', '0.5')]
+
+    columns_path = str(tmpdir.join('results.columns'))
+    with open(columns_path, 'wb') as f:
+        ramble.results.write_columns(results.items(), f, variables=variables)
+    table = ramble.results.read_columns(columns_path)
+    assert table['value'][:3] == [1.825, 1.825, 3.0]
+    assert math.isnan(table['value'][3])
+    assert table['ratio'] == [0.5] * 4
+
+
+def test_results_database(tmpdir):
+    db = ramble.results.ResultsDatabase(str(tmpdir.join('results.db')))
+
+    first = sample_results(4)
+    db.add_analysis(first.items(), timestamp='2022-01-01 00:00:00')
+
+    second = sample_results(4)
+    second['app.wl.exp_0']['CONTEXTS']['null']['time']['value'] = '0.25'
+    db.add_analysis(second.items(), timestamp='2022-01-02 00:00:00')
+
+    columns, rows = db.query()
+    assert columns[:8] == ['analysis', 'timestamp', 'experiment', 'status',
+                           'context', 'fom', 'value', 'units']
+    assert len(rows) == 8
+    assert rows[0] == (1, '2022-01-01 00:00:00', 'app.wl.exp_0', 'SUCCESS',
+                       'null', 'time', '0.5', 's')
+    assert rows[1][2:6] == ('app.wl.exp_1', 'FAILED', None, None)
+
+    _, rows = db.query(fom='time', latest=True)
+    assert [row[2] for row in rows] == ['app.wl.exp_0', 'app.wl.exp_2']
+    assert rows[0][6] == '0.25'
+
+    _, rows = db.query(status='FAILED', application='app')
+    assert len(rows) == 4
+
+    _, rows = db.query(variables={'n_ranks': '2'})
+    assert [row[6] for row in rows] == ['2.5', '2.5']
+
+    columns, rows = db.query(fom='time', group_by=['n_ranks'],
+                             aggregate='min')
+    assert columns == ['n_ranks', 'fom', 'min', 'units']
+    assert rows == [('0', 'time', 0.25, 's'), ('2', 'time', 2.5, 's')]
+
+    columns, rows = db.query(group_by=['experiment'], aggregate='count')
+    assert rows == [('exp_0', 'time', 2, 's'), ('exp_2', 'time', 2, 's')]
+
+    with pytest.raises(ramble.results.ResultsDatabaseError):
+        db.query(aggregate='median')
+
+
+def test_results_database_float_aggregates(tmpdir):
+    db = ramble.results.ResultsDatabase(str(tmpdir.join('results.db')))
+
+    results = {}
+    samples = {'1': [1.825, 2.5], '2': [1.675, 1.75]}
+    for n_nodes, values in samples.items():
+        for i, value in enumerate(values):
+            results['wrfv4.CONUS_12km.exp_%s_%s' % (n_nodes, i)] = {
+                'RAMBLE_STATUS': 'SUCCESS',
+                'RAMBLE_VARIABLES': {'n_nodes': n_nodes},
+                'CONTEXTS': {'null': {
+                    'Average Timestep Time': {'value': value, 'units': 's'},
+                    'Text Time': {'value': str(value), 'units': 's'}}}
+            }
+    db.add_analysis(results.items())
+
+    for fom in ['Average Timestep Time', 'Text Time']:
+        for aggregate, expected in [('min', [1.825, 1.675]),
+                                    ('max', [2.5, 1.75]),
+                                    ('avg', [2.1625, 1.7125])]:
+            _, rows = db.query(fom=fom, group_by=['n_nodes'],
+                               aggregate=aggregate)
+            assert [row[0] for row in rows] == ['1', '2']
+            assert [row[2] for row in rows] == pytest.approx(expected)
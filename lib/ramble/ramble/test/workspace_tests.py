@@ -7,6 +7,7 @@
 # except according to those terms.
 
 import os
+import stat
 
 import pytest
 
@@ -29,3 +30,96 @@ def test_re_read(tmpdir):
         test_workspace = ramble.workspace.Workspace(os.getcwd(), True)
         test_workspace.clear()
         test_workspace._re_read()
+
+
+def test_application_configs_read_on_demand(tmpdir):
+    app_dir = tmpdir.ensure('app_configs', dir=True)
+    for idx in range(3):
+        app_dir.join('app_%s.yaml' % idx).write("""
+applications:
+  basic_%s:
+    workloads:
+      test_wl:
+        experiments:
+          test_exp:
+            variables:
+              n_ranks: '1'
+""" % idx)
+
+    ws_dir = tmpdir.join('ws')
+    ws = ramble.workspace.Workspace(str(ws_dir))
+    ws.write()
+    with open(ws.config_file_path, 'w+') as f:
+        f.write("""
+ramble:
+  application_directories:
+  - %s
+  variables: {}
+  applications: {}
+spack:
+  concretized: false
+""" % str(app_dir))
+
+    ws = ramble.workspace.Workspace(str(ws_dir))
+    assert len(ws.application_configs) == 3
+    assert all(config['yaml'] is None
+               for config in ws.application_configs.values())
+
+    apps = ws.all_applications()
+    assert next(apps)[0] == 'basic_0'
+    assert [config['yaml'] is not None
+            for _, config in sorted(ws.application_configs.items())] == \
+        [True, False, False]
+
+    assert [app[0] for app in apps] == ['basic_1', 'basic_2']
+    assert all(config['yaml'] is not None
+               for config in ws.application_configs.values())
+
+
+def test_config_cache(tmpdir, monkeypatch):
+    ws_dir = str(tmpdir.join('ws'))
+    ws = ramble.workspace.Workspace(ws_dir)
+    ws.write()
+    ws = ramble.workspace.Workspace(ws_dir)
+    expected = ws._get_workspace_dict()
+    assert os.listdir(ws.config_cache_dir)
+
+    def fail_read(*args):
+        raise AssertionError('config was parsed instead of cached')
+
+    with monkeypatch.context() as m:
+        m.setattr(ramble.workspace.workspace, '_read_yaml', fail_read)
+        ws = ramble.workspace.Workspace(ws_dir)
+        assert ws._get_workspace_dict() == expected
+
+    with open(ws.config_file_path, 'a') as f:
+        f.write('# changed\n')
+
+    with monkeypatch.context() as m:
+        m.setattr(ramble.workspace.workspace, '_read_yaml', fail_read)
+        with pytest.raises(AssertionError):
+            ramble.workspace.Workspace(ws_dir)
+
+    ws = ramble.workspace.Workspace(ws_dir)
+    assert ws._get_workspace_dict() == expected
+
+    # Cache files other users can write are never loaded
+    for cache_file in os.listdir(ws.config_cache_dir):
+        cache_path = os.path.join(ws.config_cache_dir, cache_file)
+        assert not os.stat(cache_path).st_mode & (stat.S_IRWXG | stat.S_IRWXO)
+        os.chmod(cache_path, 0o666)
+
+    with monkeypatch.context() as m:
+        m.setattr(ramble.workspace.workspace, '_read_yaml', fail_read)
+        with pytest.raises(AssertionError):
+            ramble.workspace.Workspace(ws_dir)
+
+    # Touching a config file, without changing it, also invalidates its cache
+    ws = ramble.workspace.Workspace(ws_dir)
+    mtime = os.path.getmtime(ws.config_file_path) + 10
+    os.utime(ws.config_file_path, (mtime, mtime))
+
+    with monkeypatch.context() as m:
+        m.setattr(ramble.workspace.workspace, '_read_yaml', fail_read)
+        with pytest.raises(AssertionError):
+            ramble.workspace.Workspace(ws_dir)
@@ -0,0 +1,189 @@
+# Copyright 2022 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 <LICENSE-APACHE or
+# https://www.apache.org/licenses/LICENSE-2.0> or the MIT license
+# <LICENSE-MIT or https://opensource.org/licenses/MIT>, at your
+# option. This file may not be copied, modified, or distributed
+# except according to those terms.
+"""Timing and progress reporting of workspace pipelines
+
+A PipelineTimer records how long each phase of each experiment takes while
+a pipeline runs, and can write the timings as a JSON report. It can also
+drive a ProgressBar showing the number of experiments done, and an
+estimate of the remaining time.
+"""
+
+import collections
+import contextlib
+import datetime
+import sys
+import time
+
+import spack.util.spack_json as sjson
+
+
+class PipelineTimer(object):
+    """Records the time spent in each phase of each experiment of a pipeline
+
+    Arguments:
+        pipeline (str): Name of the pipeline
+        total (int): Number of experiments the pipeline will process. Only
+                     used for progress reporting
+        progress (ProgressBar): Progress bar to update as experiments finish
+    """
+
+    def __init__(self, pipeline, total=None, progress=None):
+        self.pipeline = pipeline
+        self.total = total
+        self.progress = progress
+        self.start_time = datetime.datetime.now()
+        self.start = time.time()
+        self.end = None
+        self.experiments = []
+        self.pipeline_phases = collections.OrderedDict()
+        self._current = None
+        self._phase = None
+
+    def start_experiment(self, name, application, workload):
+        """Start timing the experiment name, finishing the previous one"""
+        self.finish_experiment()
+        self._current = {
+            'name': name,
+            'application': application,
+            'workload': workload,
+            'start': time.time(),
+            'phases': collections.OrderedDict()
+        }
+
+    def finish_experiment(self):
+        """Finish timing the current experiment, if any"""
+        if self._current is None:
+            return
+
+        exp = self._current
+        exp['seconds'] = time.time() - exp.pop('start')
+        self.experiments.append(exp)
+        self._current = None
+
+        if self.progress:
+            self.progress.update(len(self.experiments), self.total,
+                                 time.time() - self.start)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time a phase of the current experiment, or of the pipeline itself
+        when no experiment is being timed"""
+        phases = self._current['phases'] if self._current \
+            else self.pipeline_phases
+        outer_phase = self._phase
+        self._phase = (phases, name)
+        start = time.time()
+        try:
+            yield
+        finally:
+            phases[name] = phases.get(name, 0.0) + time.time() - start
+            self._phase = outer_phase
+
+    def deferred_phase(self):
+        """Return a function adding seconds to the running phase
+
+        The phase is that of the current experiment, and the function can be
+        called once the experiment finished, to time the work the phase
+        handed off, such as tasks run by another process.
+        """
+        if self._phase is None:
+            return None
+
+        phases, name = self._phase
+
+        def add_time(seconds):
+            phases[name] = phases.get(name, 0.0) + seconds
+        return add_time
+
+    def stop(self):
+        """Finish timing the current experiment and the pipeline"""
+        self.finish_experiment()
+        self.end = time.time()
+        if self.progress:
+            self.progress.finish()
+
+    def report(self):
+        """Return the timings as a dict
+
+        Besides the timings of every experiment, phase times are summed over
+        all experiments and for each application.
+        """
+        phases = collections.OrderedDict()
+        applications = collections.OrderedDict()
+        for exp in self.experiments:
+            app_phases = applications.setdefault(exp['application'],
+                                                 collections.OrderedDict())
+            for phase, seconds in exp['phases'].items():
+                summary = phases.setdefault(phase, {'count': 0,
+                                                    'seconds': 0.0})
+                summary['count'] += 1
+                summary['seconds'] += seconds
+                app_phases[phase] = app_phases.get(phase, 0.0) + seconds
+
+        end = self.end if self.end else time.time()
+        return collections.OrderedDict([
+            ('pipeline', self.pipeline),
+            ('start', self.start_time.isoformat(' ')),
+            ('seconds', end - self.start),
+            ('n_experiments', len(self.experiments)),
+            ('pipeline_phases', self.pipeline_phases),
+            ('phases', phases),
+            ('applications', applications),
+            ('experiments', self.experiments),
+        ])
+
+    def write(self, path):
+        """Write the timing report to path as JSON"""
+        with open(path, 'w') as f:
+            sjson.dump(self.report(), f)
+
+
+class ProgressBar(object):
+    """Single line progress bar, redrawn in place on a terminal
+
+    When the stream is not a terminal, nothing is drawn.
+    """
+
+    def __init__(self, label, stream=None, width=30):
+        self.label = label
+        self.stream = stream if stream else sys.stderr
+        self.width = width
+        self.enabled = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self._drawn = False
+
+    def update(self, done, total, elapsed):
+        if not self.enabled:
+            return
+
+        if total:
+            filled = int(self.width * min(done, total) / total)
+            bar = '[%s%s] %s/%s' % ('#' * filled, '.' * (self.width - filled),
+                                    done, total)
+        else:
+            bar = '%s' % done
+
+        eta = ''
+        if total and done and done < total:
+            remaining = elapsed / done * (total - done)
+            eta = ' ETA %s' % format_seconds(remaining)
+
+        self.stream.write('\r%s %s experiments%s\033[K' %
+                          (self.label, bar, eta))
+        self.stream.flush()
+        self._drawn = True
+
+    def finish(self):
+        if self._drawn:
+            self.stream.write('\n')
+            self.stream.flush()
+            self._drawn = False
+
+
+def format_seconds(seconds):
+    """Format a number of seconds as H:MM:SS"""
+    return str(datetime.timedelta(seconds=int(seconds)))
@@ -7,12 +7,18 @@
 # except according to those terms.
 
 import os
+import collections
+import concurrent.futures
 import contextlib
 import copy
+import hashlib
+import json
+import pickle
 import re
 import shutil
 import stat
 import datetime
+import time
 
 import six
 
@@ -26,8 +32,10 @@ import ramble.error
 import ramble.repository
 import ramble.spack_runner
 import ramble.expander
+import ramble.util.timer
 import ramble.util.web
 import ramble.fetch_strategy
+import ramble.results
 
 import spack.util.spack_yaml as syaml
 import spack.util.spack_json as sjson
@@ -70,6 +78,18 @@ workspace_log_path = 'logs'
 #: Name of subdirectory within workspaces where experiments are stored
 workspace_experiment_path = 'experiments'
 
+#: Name of subdirectory within workspaces caching validated config files
+workspace_config_cache_path = '.config_cache'
+
+#: Version of the config cache format. Cached configs with other versions
+#: are ignored.
+config_cache_version = 2
+
+#: Number of experiment tasks that can be in flight per job, when pipelines
+#: run with multiple jobs. Once reached, the oldest task is waited for before
+#: another one is submitted.
+experiment_tasks_per_job = 4
+
 #: Name of subdirectory within workspaces where input files are stored
 workspace_input_path = 'inputs'
 
@@ -146,6 +166,19 @@ spack:
 
 workspace_all_experiments_file = 'all_experiments'
 
+#: Name of the file caching analysis results between runs
+workspace_analysis_cache_file = 'analysis_cache.json'
+
+#: Name of the file results are streamed to while analyzing
+workspace_results_stream_file = 'results_stream.jsonl'
+
+#: Name of the database recording the results of every analysis
+workspace_results_database_file = 'results.db'
+
+#: Version of the analysis cache format. Caches with other versions are
+#: ignored.
+analysis_cache_version = 1
+
 workspace_execution_template = 'execute_experiment' + \
     workspace_template_extension
 
@@ -420,6 +453,28 @@ class Workspace(object):
         self.txlock = lk.Lock(self._transaction_lock_path)
         self.dry_run = dry_run
 
+        # Outputs of experiment tasks, in experiment order, and the pipeline
+        # function consuming them. Only set while a pipeline is running.
+        self._task_pool = None
+        self._max_experiment_tasks = None
+        self._experiment_tasks = None
+        self._consume_task = None
+
+        # Timer of the running pipeline. Only set while a pipeline is running
+        # with timing or progress reporting enabled.
+        self.pipeline_timer = None
+
+        # Cached analysis results, keyed by experiment namespace. Only set
+        # while the analyze pipeline is running.
+        self._analysis_cache = None
+        self._analysis_cache_experiments = None
+
+        # Experiment variables added as columns of the tabular results
+        # formats. Always recorded in results, even when only referenced
+        # variables are.
+        self.results_table_variables = list(
+            ramble.results.default_table_variables)
+
         self.configs = ramble.config.ConfigScope('workspace', self.config_dir)
         self._templates = {}
 
@@ -429,14 +484,22 @@ class Workspace(object):
 
         self.results = None
 
+        # Stream of the results of the analyze pipeline. Results are written
+        # to it as experiments are analyzed, instead of being held in
+        # self.results.
+        self._results_stream = None
+
         # Key for each application config should be it's filepath
         # Format for an application config should be:
         #  {
         #     'filename': <filename>,
         #     'path': <filepath>,
+        #     'mtime': <mtime when indexed or read>,
         #     'raw_yaml': <raw_yaml>,
         #     'yaml': <yaml>
         #  }
+        # Application configs are only indexed when the workspace is read.
+        # 'raw_yaml' and 'yaml' are None until the file is first needed.
         self.application_configs = {}
 
         self._read()
@@ -485,9 +548,14 @@ class Workspace(object):
             template_name = workspace_execution_template[0:-ext_len]
             self._read_template(template_name, template_execute_script)
 
-        self._read_all_application_configs()
+        self._index_application_configs()
+
+    def _index_application_configs(self):
+        """Record the application config files in application directories
 
-    def _read_all_application_configs(self):
+        Files are only parsed and validated when they are first needed, see
+        _get_application_dict_config.
+        """
         path_replacements = {
             'workspace': self.root,
             'workspace_config': self.config_dir
@@ -503,27 +571,35 @@ class Workspace(object):
                         'Application directory %s does not exist'
                         % app_dir)
                 for (dirpath, _, filenames) in os.walk(app_dir):
-                    for file in filenames:
+                    for file in sorted(filenames):
                         if file.endswith('.yaml'):
                             full_path = '%s/%s' % (dirpath, file)
-                            with open(full_path, 'r') as f:
-                                self._read_application_config(
-                                    full_path,
-                                    f)
+                            self._index_application_config(full_path)
 
-    def _read_application_config(self, path, f, raw_yaml=None):
-        """Read an application configuration file"""
+    def _index_application_config(self, path):
+        """Record an application configuration file, without reading it"""
         if path not in self.application_configs:
             self.application_configs[path] = {
                 'filename': os.path.basename(path),
                 'path': path,
+                'mtime': os.path.getmtime(path),
                 'schema': applications_schema,
                 'raw_yaml': None,
                 'yaml': None
             }
+        return self.application_configs[path]
 
+    def _load_application_config(self, path):
+        """Read an indexed application configuration file if it has not been
+        read yet, or if it was modified since it was read"""
         config = self.application_configs[path]
-        self._read_yaml(config, f, raw_yaml)
+        mtime = os.path.getmtime(path)
+        if config['yaml'] is None or mtime != config['mtime']:
+            tty.debug('Reading application config %s' % path)
+            config['mtime'] = mtime
+            with open(path, 'r') as f:
+                self._read_yaml(config, f)
+        return config
 
     def _read_config(self, section, f, raw_yaml=None):
         """Read configuration file"""
@@ -535,8 +611,71 @@ class Workspace(object):
             _, config['yaml'] = _read_yaml(f, config['schema'])
             config['raw_yaml'], _ = _read_yaml(raw_yaml, config['schema'])
         else:
-            config['raw_yaml'], config['yaml'] = _read_yaml(f,
-                                                            config['schema'])
+            config['raw_yaml'], config['yaml'] = \
+                self._read_cached_yaml(f, config['schema'])
+
+    def _read_cached_yaml(self, f, schema):
+        """Read and validate YAML from a file, using the config cache
+
+        The parsed and validated contents of each config file are cached in
+        the workspace, keyed by the file's content, modification time and
+        size, and the schema it is validated against. When none of them
+        changed, the cached contents are loaded instead of parsing and
+        validating the file again.
+
+        The cache is pickled to keep the comments and line marks of the
+        parsed YAML. Loading a pickle can run arbitrary code, so cache files
+        are only loaded if they are owned by the current user, and cannot be
+        written by anyone else.
+        """
+        path = getattr(f, 'name', None)
+        if not path or not os.path.isdir(self.root):
+            return _read_yaml(f, schema)
+
+        content = f.read()
+        source_stat = os.fstat(f.fileno())
+        key = '%s\n%s\n%r\n%s\n' % (
+            config_cache_version, _schema_digest(schema),
+            source_stat.st_mtime, source_stat.st_size)
+        digest = hashlib.sha256((key + content).encode('utf-8')).hexdigest()
+        cache_path = os.path.join(
+            self.config_cache_dir,
+            hashlib.sha256(path.encode('utf-8')).hexdigest() + '.pickle')
+
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as cache_file:
+                    if not _private_file(cache_file):
+                        raise RambleWorkspaceError(
+                            'cache file is not private to the current user')
+                    cached = pickle.load(cache_file)
+                if cached['digest'] == digest:
+                    tty.debug('Using cached config for %s' % path)
+                    return cached['raw_yaml'], cached['yaml']
+            # Unpickling can fail in many ways, any of them is a cache miss
+            except Exception as e:
+                tty.debug('Ignoring invalid config cache %s: %s' %
+                          (cache_path, e))
+
+        f.seek(0)
+        raw_yaml, default_yaml = _read_yaml(f, schema)
+
+        try:
+            fs.mkdirp(self.config_cache_dir, mode=stat.S_IRWXU)
+            tmp_path = '%s.%s.tmp' % (cache_path, os.getpid())
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         stat.S_IRUSR | stat.S_IWUSR)
+            with os.fdopen(fd, 'wb') as cache_file:
+                pickle.dump({'digest': digest, 'raw_yaml': raw_yaml,
+                             'yaml': default_yaml}, cache_file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, cache_path)
+        except (IOError, OSError) as e:
+            tty.debug('Unable to write config cache %s: %s' % (cache_path, e))
+
+        return raw_yaml, default_yaml
 
     def _read_template(self, name, f):
         """Read a tempalte file"""
@@ -689,7 +828,7 @@ class Workspace(object):
 
     def clear(self):
         self.config_sections = {}
-        self.application_configs = []
+        self.application_configs = {}
         self._previous_active = None      # previously active environment
         self.specs = []
 
@@ -1011,52 +1150,72 @@ class Workspace(object):
         return
 
     def append_result(self, result):
+        if self._results_stream:
+            self._results_stream.append(result)
+            return
+
         if not self.results:
             self.results = {}
 
         self.results.update(result)
 
-    def dump_results(self, output_formats=['text']):
-        if not self.results:
-            self.results = {}
+    @property
+    def results_database(self):
+        """Database of the results of all analyses of the workspace"""
+        return ramble.results.ResultsDatabase(
+            os.path.join(self.root, workspace_results_database_file))
+
+    @property
+    def results_stream_path(self):
+        """Path of the stream of results written while analyzing"""
+        return os.path.join(self.root, workspace_results_stream_file)
+
+    def dump_results(self, output_formats=['text'], table_variables=None):
+        """Write the results of the workspace in each of output_formats
+
+        Results streamed by the analyze pipeline are read back one experiment
+        at a time. Otherwise, the results added with append_result are used.
+
+        Tabular formats get a column for each of table_variables, or for
+        each of results_table_variables if it is not given.
+        """
+        if table_variables is None:
+            table_variables = self.results_table_variables
+
+        if self._results_stream:
+            self._results_stream.close()
+
+            def records():
+                return self._results_stream.records()
+        else:
+            if not self.results:
+                self.results = {}
+
+            def records():
+                return iter(self.results.items())
 
         results_written = []
 
         dt = self._date_string()
         filename_base = 'results.' + dt
 
-        if 'text' in output_formats:
-
-            out_file = os.path.join(self.root, filename_base + '.txt')
-            results_written.append(out_file)
+        for name, output_format in ramble.results.output_formats.items():
+            if name not in output_formats:
+                continue
 
-            with open(out_file, 'w+') as f:
-                for exp, results in self.results.items():
-                    f.write('Experiment %s figures of merit:\n' %
-                            exp)
-                    f.write('  Status = %s\n' %
-                            results['RAMBLE_STATUS'])
-                    if results['RAMBLE_STATUS'] == 'SUCCESS':
-                        for context, foms in \
-                                results['CONTEXTS'].items():
-                            f.write('  %s figures of merit:\n' %
-                                    context)
-                            for name, fom in foms.items():
-                                output = '%s = %s %s' % (name,
-                                                         fom['value'],
-                                                         fom['units'])
-                                f.write('    %s\n' % (output.strip()))
-        if 'json' in output_formats:
-            out_file = os.path.join(self.root, filename_base + '.json')
+            out_file = os.path.join(self.root,
+                                    filename_base + output_format.extension)
             results_written.append(out_file)
-            with open(out_file, 'w+') as f:
-                sjson.dump(self.results, f)
+            with open(out_file, 'wb' if output_format.binary else 'w+') as f:
+                if output_format.tabular:
+                    output_format.writer(records(), f,
+                                         variables=table_variables)
+                else:
+                    output_format.writer(records(), f)
 
-        if 'yaml' in output_formats:
-            out_file = os.path.join(self.root, filename_base + '.yaml')
-            results_written.append(out_file)
-            with open(out_file, 'w+') as f:
-                syaml.dump(self.results, stream=f)
+        if self._results_stream:
+            fs.force_remove(self._results_stream.path)
+            self._results_stream = None
 
         if not results_written:
             tty.die('Results were not written.')
@@ -1076,7 +1235,22 @@ class Workspace(object):
 
         experiment_script()
 
-    def run_pipeline(self, pipeline):
+    def run_pipeline(self, pipeline, experiment_filter=None, jobs=1,
+                     timing=False, progress=False):
+        """Run the phases of pipeline on all experiments in the workspace
+
+        If experiment_filter is given, only experiments it matches are
+        rendered and have their phases executed.
+
+        With jobs > 1, experiments are rendered during setup (see
+        render_experiment), and their logs are scanned during analyze (see
+        analyze_experiment) in a pool of worker processes. All other phases
+        are always executed serially.
+
+        With timing, the time spent in each phase of each experiment is
+        written as a JSON report in the workspace log directory. With
+        progress, a progress bar of the experiments done is shown.
+        """
         all_experiments_file = None
         expander = ramble.expander.Expander(self)
 
@@ -1095,8 +1269,6 @@ class Workspace(object):
             all_experiments_file = open(all_experiments_path, 'w+')
             all_experiments_file.write('#!/bin/sh\n')
 
-            expander.set_var('experiments_file', all_experiments_file)
-
             runner = ramble.spack_runner.SpackRunner(dry_run=self.dry_run)
             spack_dict = self.get_spack_dict()
             if compiler_namespace in spack_dict:
@@ -1107,16 +1279,108 @@ class Workspace(object):
                                                 use_custom_specifier=False)
                     runner.install_compiler(comp_str)
 
+        if jobs > 1 and pipeline in ['setup', 'analyze']:
+            self._task_pool = \
+                concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+            self._max_experiment_tasks = jobs * experiment_tasks_per_job
+
+        if pipeline == 'analyze':
+            self._read_analysis_cache()
+            self._analysis_cache_experiments = set()
+            self.results = None
+            self._results_stream = \
+                ramble.results.ResultsStream(self.results_stream_path)
+
+        render_counts = collections.OrderedDict(
+            [('created', 0), ('updated', 0), ('unchanged', 0)])
+
+        def consume_task(task_out):
+            if pipeline == 'setup':
+                experiment_line, status = task_out
+                all_experiments_file.write(experiment_line)
+                render_counts[status] += 1
+            elif pipeline == 'analyze':
+                self.append_result(task_out)
+
+        if timing or progress:
+            total = None
+            progress_bar = None
+            if progress:
+                total = self._count_experiments(experiment_filter)
+                progress_bar = ramble.util.timer.ProgressBar(
+                    '%s:' % pipeline.capitalize())
+            self.pipeline_timer = ramble.util.timer.PipelineTimer(
+                pipeline, total=total, progress=progress_bar)
+
+        self._experiment_tasks = collections.deque()
+        self._consume_task = consume_task
+        try:
+            self._run_pipeline_phases(pipeline, expander, experiment_filter)
+
+            if self.pipeline_timer:
+                self.pipeline_timer.finish_experiment()
+                with self.pipeline_timer.phase('experiment_tasks'):
+                    self._consume_experiment_tasks(wait=True)
+            else:
+                self._consume_experiment_tasks(wait=True)
+
+            if pipeline == 'analyze':
+                self._write_analysis_cache()
+                self._results_stream.close()
+                self.results_database.add_analysis(
+                    self._results_stream.records())
+        finally:
+            if self._task_pool:
+                for task_out, _, _ in self._experiment_tasks:
+                    if isinstance(task_out, concurrent.futures.Future):
+                        task_out.cancel()
+                self._task_pool.shutdown()
+                self._task_pool = None
+                self._max_experiment_tasks = None
+            self._experiment_tasks = None
+            self._consume_task = None
+            self._analysis_cache = None
+            self._analysis_cache_experiments = None
+            if self._results_stream:
+                self._results_stream.close()
+            timer = self.pipeline_timer
+            self.pipeline_timer = None
+            if timer:
+                timer.stop()
+
+        if timing:
+            fs.mkdirp(self.log_dir)
+            timing_path = os.path.join(
+                self.log_dir, 'timing.%s.%s.json' % (pipeline,
+                                                     self._date_string()))
+            timer.write(timing_path)
+            tty.msg('Pipeline timing written to %s' % timing_path)
+
+        if pipeline == 'setup':
+            all_experiments_file.close()
+
+            tty.msg('Experiments: ' +
+                    ', '.join('%s %s' % (count, status)
+                              for status, count in render_counts.items()))
+
+            all_experiments_path = os.path.join(self.root,
+                                                workspace_all_experiments_file)
+            os.chmod(all_experiments_path, stat.S_IRWXU | stat.S_IRWXG
+                     | stat.S_IROTH | stat.S_IXOTH)
+
+    def _experiment_scopes(self, expander, on_application=None):
+        """Iterate over the experiment definitions of the workspace
+
+        The application, workload, and experiment scopes of expander are set
+        before yielding for each experiment definition. on_application, if
+        given, is called after each application scope is set.
+        """
         for app, workloads, app_vars, app_env_vars in self.all_applications():
             expander.set_application(app)
             expander.set_application_vars(app_vars)
             expander.set_application_env_vars(app_env_vars)
-            tty.debug('Getting application: %s' % app)
-            tty.debug('Getting application: %s' % expander.application_name)
-            app_inst = ramble.repository.get(expander.application_name)
-
-            tty.msg('  Working on ' + app_inst.application_class +
-                    ' ' + app_inst.name)
+            if on_application:
+                on_application()
 
             for workload, experiments, workload_vars, workload_env_vars in \
                     self.all_workloads(workloads):
@@ -1130,19 +1394,198 @@ class Workspace(object):
                     expander.set_experiment_vars(exp_vars)
                     expander.set_experiment_env_vars(exp_env_vars)
                     expander.set_experiment_matrices(exp_matrices)
+                    yield
+
+    def _run_pipeline_phases(self, pipeline, expander, experiment_filter):
+        def working_on():
+            tty.debug('Getting application: %s' % expander.application_name)
+            app_inst = ramble.repository.get(expander.application_name)
 
-                    for _ in expander.rendered_experiments():
-                        app_inst = ramble.repository.get(expander.application_name)
-                        for phase in app_inst.get_pipeline_phases(pipeline):
-                            app_inst.run_phase(phase, self, expander)
+            tty.msg('  Working on ' + app_inst.application_class +
+                    ' ' + app_inst.name)
 
-        if pipeline == 'setup':
-            all_experiments_file.close()
+        # Experiments analyzed now, or skipped by the filter, keep their
+        # cached analysis. Entries of any other experiment are stale.
+        keep_cached = self._analysis_cache_experiments
+        on_skipped = keep_cached.add if keep_cached is not None else None
+
+        timer = self.pipeline_timer
+        for _ in self._experiment_scopes(expander, on_application=working_on):
+            for _ in expander.rendered_experiments(
+                    experiment_filter=experiment_filter,
+                    on_skipped=on_skipped):
+                if keep_cached is not None:
+                    keep_cached.add(expander.experiment_namespace)
+                if timer:
+                    timer.start_experiment(expander.experiment_namespace,
+                                           expander.application_name,
+                                           expander.workload_name)
+                app_inst = ramble.repository.get(expander.application_name)
+                for phase in app_inst.get_pipeline_phases(pipeline):
+                    app_inst.run_phase(phase, self, expander)
+
+    def _count_experiments(self, experiment_filter=None):
+        """Count the experiments a pipeline would process"""
+        expander = ramble.expander.Expander(self)
+        count = 0
+        for _ in self._experiment_scopes(expander):
+            count += expander.count_experiments(
+                experiment_filter=experiment_filter)
+        return count
+
+    def render_experiment(self, render_func, *args):
+        """Render the files of a single experiment
+
+        render_func(*args) writes the experiment's files, and returns a tuple
+        of its line for the all_experiments script, and whether the experiment
+        was 'created', 'updated', or 'unchanged'. When setup runs with
+        multiple jobs, render_func is executed in a worker process. It must be
+        a module level function, and args must be picklable.
+        """
+        if self._experiment_tasks is None:
+            render_func(*args)
+        else:
+            self._run_experiment_task(render_func, *args)
 
-            all_experiments_path = os.path.join(self.root,
-                                                workspace_all_experiments_file)
-            os.chmod(all_experiments_path, stat.S_IRWXU | stat.S_IRWXG
-                     | stat.S_IROTH | stat.S_IXOTH)
+    def analyze_experiment(self, analyze_func, exp_ns, variables, *args,
+                           fingerprint=None):
+        """Extract the figures of merit of a single experiment
+
+        analyze_func(exp_ns, variables, *args) returns the experiment's
+        results, which are added to the workspace results with append_result.
+        When analyze runs with multiple jobs, analyze_func is executed in a
+        worker process. It must be a module level function, and args must be
+        picklable.
+
+        If fingerprint is given, and matches the fingerprint of the experiment
+        in the analysis cache, the cached results are reused instead.
+        """
+        cached = self._cached_analysis(exp_ns, fingerprint)
+        if cached is not None:
+            results = {exp_ns: {'RAMBLE_STATUS': cached['RAMBLE_STATUS']}}
+            if 'CONTEXTS' in cached:
+                results[exp_ns]['RAMBLE_VARIABLES'] = variables
+                results[exp_ns]['CONTEXTS'] = cached['CONTEXTS']
+            on_result = None
+            func = None
+        else:
+            def on_result(results):
+                self._update_analysis_cache(exp_ns, fingerprint, results)
+            func = analyze_func
+
+        if self._experiment_tasks is None:
+            if func:
+                results = func(exp_ns, variables, *args)
+                on_result(results)
+            self.append_result(results)
+        elif func:
+            self._run_experiment_task(func, exp_ns, variables, *args,
+                                      on_result=on_result)
+        else:
+            self._experiment_tasks.append((results, None, None))
+            self._consume_experiment_tasks()
+
+    def _run_experiment_task(self, func, *args, on_result=None):
+        """Queue the output of an experiment task for run_pipeline
+
+        on_result, if given, is called with the task output when
+        run_pipeline consumes it. With multiple jobs, at most
+        _max_experiment_tasks tasks are queued, so the oldest ones are waited
+        for before submitting another.
+        """
+        add_time = None
+        if self._task_pool:
+            self._consume_experiment_tasks(
+                wait=True, keep=self._max_experiment_tasks - 1)
+            task_out = self._task_pool.submit(func, *args)
+            if self.pipeline_timer:
+                add_time = self.pipeline_timer.deferred_phase()
+        else:
+            task_out = func(*args)
+        self._experiment_tasks.append((task_out, on_result, add_time))
+        self._consume_experiment_tasks()
+
+    def _consume_experiment_tasks(self, wait=False, keep=0):
+        """Consume the outputs of queued experiment tasks
+
+        Task outputs are consumed in the order experiments were processed,
+        regardless of the order workers finished them. Unless wait is set,
+        consumption stops at the first task that is still running, so that
+        finished outputs are not held in memory longer than needed. The
+        last keep tasks are left queued.
+
+        When timing a pipeline with multiple jobs, the time spent collecting
+        and consuming the output of a task is added to the phase of the
+        experiment which submitted it.
+        """
+        while len(self._experiment_tasks) > keep:
+            task_out, on_result, add_time = self._experiment_tasks[0]
+            start = time.time()
+            if isinstance(task_out, concurrent.futures.Future):
+                if not wait and not task_out.done():
+                    return
+                task_out = task_out.result()
+            self._experiment_tasks.popleft()
+
+            if on_result:
+                on_result(task_out)
+            self._consume_task(task_out)
+            if add_time:
+                add_time(time.time() - start)
+
+    @property
+    def analysis_cache_path(self):
+        """Path to the cache of analysis results"""
+        return os.path.join(self.root, workspace_analysis_cache_file)
+
+    def _read_analysis_cache(self):
+        self._analysis_cache = {}
+        if os.path.exists(self.analysis_cache_path):
+            try:
+                with open(self.analysis_cache_path, 'r') as f:
+                    cache = sjson.load(f)
+                if cache.get('version') == analysis_cache_version:
+                    self._analysis_cache = cache['experiments']
+            except (ValueError, KeyError, AttributeError) as e:
+                tty.debug('Ignoring invalid analysis cache: %s' % e)
+
+    def _write_analysis_cache(self):
+        experiments = self._analysis_cache
+        if self._analysis_cache_experiments is not None:
+            experiments = dict((exp_ns, entry) for exp_ns, entry
+                               in experiments.items()
+                               if exp_ns in self._analysis_cache_experiments)
+        cache = {'version': analysis_cache_version,
+                 'experiments': experiments}
+        with open(self.analysis_cache_path, 'w') as f:
+            sjson.dump(cache, f)
+
+    def _cached_analysis(self, exp_ns, fingerprint):
+        """Return a copy of the cached results of exp_ns, if still valid"""
+        if not fingerprint or self._analysis_cache is None:
+            return None
+
+        entry = self._analysis_cache.get(exp_ns, None)
+        if entry is None or entry['fingerprint'] != fingerprint:
+            return None
+
+        tty.debug('Reusing cached analysis of %s' % exp_ns)
+        return copy.deepcopy(entry['results'])
+
+    def _update_analysis_cache(self, exp_ns, fingerprint, results):
+        if self._analysis_cache is None:
+            return
+
+        if not fingerprint:
+            self._analysis_cache.pop(exp_ns, None)
+            return
+
+        # Variables are not cached, they are always taken from the
+        # current configuration.
+        exp_results = dict(results[exp_ns])
+        exp_results.pop('RAMBLE_VARIABLES', None)
+        self._analysis_cache[exp_ns] = {'fingerprint': fingerprint,
+                                        'results': exp_results}
 
     @property
     def latest_archive_path(self):
@@ -1168,7 +1611,7 @@ class Workspace(object):
 
         return None
 
-    def archive(self, create_tar=True, archive_url=None):
+    def archive(self, create_tar=True, archive_url=None, experiment_filter=None):
         """Archive current configuration, and experiment state.
 
         Create an archive of the current configuration of this workspace, and
@@ -1185,6 +1628,9 @@ class Workspace(object):
         If an archive url is configured for ramble at config:archive_url this
         will automatically upload tar archives to that location.
 
+        If experiment_filter is given, only the state of matching experiments
+        is archived.
+
         NOTE: If the current configuration differs from the one used to create
         the experiments that are being set up, it's possible that the
         configuration cannot regenerate the same experiments.
@@ -1218,7 +1664,7 @@ class Workspace(object):
             fs.mkdirp(os.path.dirname(dest))
             shutil.copyfile(file, dest)
 
-        self.run_pipeline('archive')
+        self.run_pipeline('archive', experiment_filter=experiment_filter)
 
         if create_tar:
             tar = which('tar', required=True)
@@ -1346,6 +1792,11 @@ class Workspace(object):
         """Path to the configuration file directory"""
         return os.path.join(self.config_dir, config_file_name)
 
+    @property
+    def config_cache_dir(self):
+        """Path to the cache of validated configuration files"""
+        return os.path.join(self.root, workspace_config_cache_path)
+
     @property
     def archive_dir(self):
         """Path to the archive directory"""
@@ -1441,8 +1892,9 @@ class Workspace(object):
             in self.config_sections else None
 
     def _get_application_dict_config(self, key):
-        return self.application_configs[key]['yaml'] if key \
-            in self.application_configs else None
+        if key not in self.application_configs:
+            return None
+        return self._load_application_config(key)['yaml']
 
     def is_concretized(self):
         ws_dict = self._get_workspace_dict()
@@ -1540,6 +1992,28 @@ def _equiv_dict(first, second):
     return same_values and same_keys_with_same_overrides
 
 
+def _private_file(f):
+    """Whether the open file f is owned by the current user, and cannot be
+    written by other users"""
+    file_stat = os.fstat(f.fileno())
+    return (file_stat.st_uid == os.getuid() and
+            not file_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+
+#: Digests of schemas, keyed by the id of the schema
+_schema_digests = {}
+
+
+def _schema_digest(schema):
+    """Return a digest identifying the contents of schema"""
+    key = id(schema)
+    if key not in _schema_digests:
+        _schema_digests[key] = hashlib.sha256(
+            json.dumps(schema, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+    return _schema_digests[key]
+
+
 def _read_yaml(str_or_file, schema):
     """Read YAML from a file for round-trip parsing."""
     data = syaml.load_config(str_or_file)
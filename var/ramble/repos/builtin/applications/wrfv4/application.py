@@ -54,67 +54,22 @@ class Wrfv4(SpackApplication):
                       description='Path for CONUS 2.5km inputs.',
                       workloads=['CONUS_2p5km'])
 
-    figure_of_merit('Average Timestep Time', log_file='{experiment_run_dir}/stats.out',
-                    fom_regex='Average time:\s+(?P<avg_time>[0-9]+\.[0-9]*).*',
-                    group_name='avg_time', units='s')
+    figure_of_merit('Timestep Time', log_file='{experiment_run_dir}/rsl.out.*',
+                    fom_regex=r'Timing for main.*(?P<main_time>[0-9]+\.[0-9]*).*',
+                    group_name='main_time', units='s', fom_type='float',
+                    aggregate_only=True)
 
-    figure_of_merit('Cumulative Timestep Time', log_file='{experiment_run_dir}/stats.out',
-                    fom_regex='Cumulative time:\s+(?P<total_time>[0-9]+\.[0-9]*).*',
-                    group_name='total_time', units='s')
+    figure_of_merit_aggregate('Average Timestep Time', 'Timestep Time', 'mean')
 
-    figure_of_merit('Minimum Timestep Time', log_file='{experiment_run_dir}/stats.out',
-                    fom_regex='Min time:\s+(?P<min_time>[0-9]+\.[0-9]*).*',
-                    group_name='min_time', units='s')
+    figure_of_merit_aggregate('Cumulative Timestep Time', 'Timestep Time', 'sum')
 
-    figure_of_merit('Maximum Timestep Time', log_file='{experiment_run_dir}/stats.out',
-                    fom_regex='Max time:\s+(?P<max_time>[0-9]+\.[0-9]*).*',
-                    group_name='max_time', units='s')
+    figure_of_merit_aggregate('Minimum Timestep Time', 'Timestep Time', 'min')
 
-    figure_of_merit('Number of timesteps', log_file='{experiment_run_dir}/stats.out',
-                    fom_regex='Number of times:\s+(?P<count>[0-9]+)',
-                    group_name='count', units='')
+    figure_of_merit_aggregate('Maximum Timestep Time', 'Timestep Time', 'max')
 
-    figure_of_merit('Avg. Max Ratio Time', log_file='{experiment_run_dir}/stats.out',
-                    fom_regex='Avg time / Max time:\s+(?P<avg_max_ratio>[0-9]+\.[0-9]*).*',
-                    group_name='avg_max_ratio', units='')
+    figure_of_merit_aggregate('Number of timesteps', 'Timestep Time', 'count')
+
+    figure_of_merit_aggregate('Avg. Max Ratio Time', 'Timestep Time', 'balance')
 
     archive_pattern('{experiment_run_dir}/rsl.out.*')
     archive_pattern('{experiment_run_dir}/rsl.error.*')
-
-    def _analyze_experiments(self, workspace, expander):
-        import glob
-        import re
-        # Generate stats file
-
-        file_list = glob.glob(expander.expand_var('{experiment_run_dir}/rsl.out.*'))
-
-        if file_list:
-            timing_regex = re.compile(r'Timing for main.*(?P<main_time>[0-9]+\.[0-9]*).*')
-            avg_time = 0.0
-            min_time = float('inf')
-            max_time = float('-inf')
-            sum_time = 0.0
-            count = 0
-            for out_file in file_list:
-                with open(out_file, 'r') as f:
-                    for line in f.readlines():
-                        m = timing_regex.match(line)
-                        if m:
-                            time = float(m.group('main_time'))
-                            count += 1
-                            sum_time += time
-                            min_time = min(min_time, time)
-                            max_time = max(max_time, time)
-
-            avg_time = sum_time / max(count, 1)
-
-            stats_path = expander.expand_var('{experiment_run_dir}/stats.out')
-            with open(stats_path, 'w+') as f:
-                f.write('Average time: %s s\n' % (avg_time))
-                f.write('Cumulative time: %s s\n' % (sum_time))
-                f.write('Min time: %s s\n' % (min_time))
-                f.write('Max time: %s s\n' % (max_time))
-                f.write('Avg time / Max time: %s s\n' % (avg_time / max(max_time, float(1.0))))
-                f.write('Number of times: %s\n' % (count))
-
-        super()._analyze_experiments(workspace, expander)